@@ -0,0 +1,28 @@
+"""
+Diarscription: speaker-attributed meeting transcription (Whisper/WhisperX + pyannote).
+
+The stage modules mirror docs/pseudocode/pseudocode.md:
+    audio          decode to 16kHz mono WAV and load samples
+    denoise        streaming spectral-gating noise reduction (overlap-add STFT)
+    mapped_audio   memory-mapped WAV/PCM with zero-copy time windows
+    transcription  VAD + Whisper transcription and word alignment
+    cascade        fast model first, low-confidence spans re-run with the large one
+    repetition     detect whisper loops and re-decode only the affected windows
+    diarization    pyannote diarization, speaker assignment and separation
+    longform       windowed diarization of long recordings, speakers stitched by embedding
+    consistency    diarization vs separated sources: IoU matrix, Hungarian matching
+    tokens         tiktoken tokenization and speaker/timestamp merging
+    clips          per-utterance clip extraction, trimming and encoding
+    ingest         whisperx JSON as typed segment/word tables (lazy word text)
+    export         token array, SRT and token JSON output
+    pipeline       all of the above for one recording
+    workqueue      SQLite job queue with leases for workers on several machines
+    corpus         parallel token stages over docs/reference/audio/sample-*
+    incremental    append-only processing of recordings that keep growing
+    speakers       cross-meeting speaker registry (embedding centroids + exemplars)
+    store          SQLite results store: meetings, segments, words, turns
+    search         positional word index with phrase/proximity queries
+    autotune       per-host search for the fastest CPU transcription settings
+    profiling      named spans with Chrome-trace and JSON export
+    cli            `python -m diarscription <stage>` entry point
+"""
@@ -0,0 +1,136 @@
+import os
+import tempfile
+import subprocess
+import sys
+import stat
+import urllib.request
+import shutil
+
+from . import profiling
+
+SAMPLE_RATE = 16000
+
+# Converts audio file to 16kHz mono WAV using FFmpeg. This is required for whisperx preprocessing.
+
+def setup_ffmpeg():
+    temp_dir = tempfile.gettempdir()
+    ffmpeg_path = os.path.join(temp_dir, "ffmpeg")
+
+    if os.path.exists(ffmpeg_path):
+        return ffmpeg_path
+
+    if shutil.which("ffmpeg"):
+        return "ffmpeg"
+
+    try:
+        if sys.platform.startswith('linux'):
+            url = "https://github.com/BtbN/FFmpeg-Builds/releases/download/latest/ffmpeg-master-latest-linux64-gpl.tar.xz"
+            archive_path = os.path.join(temp_dir, "ffmpeg.tar.xz")
+            urllib.request.urlretrieve(url, archive_path)
+            subprocess.run(["tar", "-xf", archive_path, "-C", temp_dir], check=True)
+            extracted_dir = next(d for d in os.listdir(temp_dir) if d.startswith("ffmpeg-master"))
+            shutil.move(os.path.join(temp_dir, extracted_dir, "bin", "ffmpeg"), ffmpeg_path)
+            os.chmod(ffmpeg_path, stat.S_IRWXU)
+            os.remove(archive_path)
+            shutil.rmtree(os.path.join(temp_dir, extracted_dir))
+            return ffmpeg_path
+        else:
+            raise Exception("Unsupported platform")
+    except Exception as e:
+        raise Exception(f"Failed to setup FFmpeg: {e}")
+
+def preprocess_audio(input_file, ffmpeg_path=None, denoise=False):
+    """
+    Decode any input file into a temporary 16kHz mono WAV and return its path.
+    With denoise=True, stationary background noise is gated out of the WAV
+    (see denoise.py).
+    """
+    if ffmpeg_path is None:
+        ffmpeg_path = setup_ffmpeg()
+
+    with tempfile.NamedTemporaryFile(suffix=".wav", delete=False, dir=tempfile.gettempdir()) as temp_file:
+        temp_path = temp_file.name
+
+    try:
+        with profiling.span("decode", file=os.path.basename(input_file)):
+            subprocess.run([
+                ffmpeg_path, "-i", input_file, "-ar", str(SAMPLE_RATE), "-ac", "1", "-y", temp_path
+            ], capture_output=True, text=True, check=True)
+    except subprocess.CalledProcessError as e:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise Exception(f"FFmpeg failed: {e.stderr}")
+    if not denoise:
+        return temp_path
+
+    from .denoise import denoise_file
+
+    denoised_path = temp_path[:-len(".wav")] + ".denoised.wav"
+    try:
+        denoise_file(temp_path, denoised_path)
+    except Exception:
+        if os.path.exists(denoised_path):
+            os.remove(denoised_path)
+        raise
+    finally:
+        os.remove(temp_path)
+    return denoised_path
+
+def decode_pcm(input_file, start=0.0, duration=None, ffmpeg_path=None):
+    """
+    Decode part of any input file straight into memory as 16kHz mono float32,
+    without a temporary WAV. ffmpeg seeks to `start` seconds, so only the
+    requested span is decoded.
+    """
+    import numpy as np
+
+    if ffmpeg_path is None:
+        ffmpeg_path = setup_ffmpeg()
+
+    command = [ffmpeg_path, "-nostdin", "-ss", f"{start:.3f}", "-i", input_file]
+    if duration is not None:
+        command += ["-t", f"{duration:.3f}"]
+    command += ["-f", "s16le", "-acodec", "pcm_s16le", "-ar", str(SAMPLE_RATE), "-ac", "1", "-"]
+
+    with profiling.span("decode", file=os.path.basename(input_file), start=start) as span:
+        try:
+            result = subprocess.run(command, capture_output=True, check=True)
+        except subprocess.CalledProcessError as e:
+            raise Exception(f"FFmpeg failed: {e.stderr.decode(errors='replace')}")
+        samples = np.frombuffer(result.stdout, dtype=np.int16).astype(np.float32) / 32768.0
+        span.add_items(len(samples))
+    return samples
+
+def load_audio(audio_file):
+    """
+    Load a (preprocessed) audio file as a float32 NumPy array at 16kHz.
+
+    16kHz WAVs (what preprocess_audio writes) are read through a memory map;
+    anything else goes through whisperx/ffmpeg. Either way the result is the
+    whole recording in memory, which is what whisperx and pyannote take; use
+    open_mapped() for window-by-window access.
+    """
+    with profiling.span("load_audio") as span:
+        mapped = open_mapped(audio_file)
+        if mapped is not None:
+            audio = mapped.samples()
+        else:
+            import whisperx
+            audio = whisperx.load_audio(audio_file)
+        span.add_items(len(audio))
+    return audio
+
+def open_mapped(audio_file):
+    """
+    Memory-map audio_file if it is a 16kHz WAV, otherwise return None.
+    See mapped_audio.MappedAudio for windowed, zero-copy access.
+    """
+    if not audio_file.lower().endswith(".wav"):
+        return None
+    from .mapped_audio import MappedAudio
+
+    try:
+        mapped = MappedAudio(audio_file)
+    except Exception:
+        return None
+    return mapped if mapped.sample_rate == SAMPLE_RATE else None
@@ -0,0 +1,260 @@
+"""
+CPU inference autotuner for the transcription stages.
+
+Transcribes a short calibration clip under different compute types, batch
+sizes, thread counts, chunk sizes and VAD onset/offset values, measures
+throughput (real-time factor) and word error rate against a reference, and
+saves the fastest settings that stay within the allowed accuracy drift.
+
+The result is stored per host and per model in ~/.diarscription/autotune.json
+(override with DIARSCRIPTION_AUTOTUNE_FILE). transcription.resolve_settings()
+picks it up, so `transcribe` and `run` use the tuned settings unless an option
+is given explicitly on the command line.
+
+    python -m diarscription autotune meeting.wav --reference gold-reference.md --clip-seconds 60
+"""
+import json
+import os
+import re
+import socket
+import time
+
+from . import profiling
+from . import transcription
+from .audio import SAMPLE_RATE
+
+DEFAULT_CANDIDATES = {
+    "compute_type": ["float32", "int8"],
+    "batch_size": [4, 8, 16, 32],
+    "threads": None,  # filled in from the core count, see default_candidates()
+    "chunk_size": [6, 10, 15, 30],
+    "vad": [(0.5, 0.363), (0.4, 0.363), (0.5, 0.5), (0.6, 0.45)],
+}
+
+# Untimed transcription after every model load, so load and warm-up cost (lazy
+# initialisation, first VAD call, allocator growth) isn't charged to the first
+# trial of that model; otherwise the baseline looks slow and everything after it fast
+WARMUP_SECONDS = 10.0
+
+# Order parameters are tuned in: the ones with the biggest effect on speed first
+TUNING_ORDER = ["compute_type", "threads", "batch_size", "chunk_size", "vad"]
+
+TIME_LINE = re.compile(r'(\d{2}):(\d{2}):(\d{2}),(\d{3})\s+-->\s+(\d{2}):(\d{2}):(\d{2}),(\d{3})')
+SPEAKER_PREFIX = re.compile(r'^(\d+\s+)?(\d{2}:\d{2}:\d{2},\d{3}\s+-->\s+\d{2}:\d{2}:\d{2},\d{3}\s+)?\[?SPEAKER_\d+\]?:\s*')
+
+
+def profile_path():
+    return os.environ.get("DIARSCRIPTION_AUTOTUNE_FILE",
+                          os.path.join(os.path.expanduser("~"), ".diarscription", "autotune.json"))
+
+
+def host_key():
+    return socket.gethostname()
+
+
+def load_host_profile(model_name, path=None):
+    """
+    Return the tuned settings saved for this host and model, or {} if there are none.
+    """
+    path = path or profile_path()
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            profiles = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return profiles.get(host_key(), {}).get(model_name, {}).get("settings", {})
+
+
+def save_host_profile(model_name, settings, report, path=None):
+    path = path or profile_path()
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            profiles = json.load(f)
+    except (OSError, ValueError):
+        profiles = {}
+
+    profiles.setdefault(host_key(), {})[model_name] = {
+        "settings": settings,
+        "tuned_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "cpu_count": os.cpu_count(),
+        "report": report,
+    }
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(profiles, f, indent=2)
+    return path
+
+
+def default_candidates():
+    candidates = dict(DEFAULT_CANDIDATES)
+    cores = os.cpu_count() or 1
+    candidates["threads"] = sorted({1, max(1, cores // 2), cores})
+    return candidates
+
+
+def normalize_words(text):
+    return re.findall(r"[a-z0-9']+", text.lower())
+
+
+def word_error_rate(reference, hypothesis):
+    """
+    Word-level Levenshtein distance divided by the reference length.
+    """
+    ref = normalize_words(reference)
+    hyp = normalize_words(hypothesis)
+    if not ref:
+        return 0.0 if not hyp else 1.0
+
+    previous = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, 1):
+        current = [i] + [0] * len(hyp)
+        for j, hyp_word in enumerate(hyp, 1):
+            current[j] = min(previous[j] + 1,                            # deletion
+                             current[j - 1] + 1,                         # insertion
+                             previous[j - 1] + (ref_word != hyp_word))   # substitution
+        previous = current
+    return previous[-1] / len(ref)
+
+
+def read_reference_text(path, start=0.0, end=None):
+    """
+    Read the reference transcript text between start and end seconds.
+
+    Understands the gold-reference.md SRT layout and the one-line formatted_srt.md
+    layout; anything else is treated as plain text covering the whole clip.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        lines = f.read().splitlines()
+
+    if not any(TIME_LINE.search(line) for line in lines):
+        return " ".join(lines)
+
+    words = []
+    cue_start = None
+    for line in lines:
+        match = TIME_LINE.search(line)
+        if match:
+            h, m, s, ms = map(int, match.groups()[0:4])
+            cue_start = h * 3600 + m * 60 + s + ms / 1000.0
+        if cue_start is None or cue_start < start or (end is not None and cue_start >= end):
+            continue
+        text = SPEAKER_PREFIX.sub("", line.strip())
+        if text and not TIME_LINE.fullmatch(text) and not text.isdigit():
+            words.append(text)
+    return " ".join(words)
+
+
+def _segments_text(result):
+    return " ".join(segment["text"].strip() for segment in result["segments"])
+
+
+def run_trial(clip, settings, model_name, models):
+    """
+    Transcribe the clip once with the given settings.
+    Models are cached in `models` by the settings that require a reload; a
+    freshly loaded model gets an untimed warm-up run first.
+    Returns (text, wall seconds).
+    """
+    model_key = (settings["compute_type"], settings["threads"], settings["vad_onset"], settings["vad_offset"])
+    model = models.get(model_key)
+    if model is None:
+        models.clear()  # keep at most one model in memory
+        model = models[model_key] = transcription.load_model(
+            model_name,
+            compute_type=settings["compute_type"],
+            vad_onset=settings["vad_onset"],
+            vad_offset=settings["vad_offset"],
+            threads=settings["threads"],
+        )
+        with profiling.span("autotune_warmup"):
+            transcription.transcribe(model, clip[:int(WARMUP_SECONDS * SAMPLE_RATE)],
+                                     batch_size=settings["batch_size"], chunk_size=settings["chunk_size"])
+
+    start = time.perf_counter()
+    with profiling.span("autotune_trial", **settings):
+        result = transcription.transcribe(model, clip, batch_size=settings["batch_size"],
+                                          chunk_size=settings["chunk_size"])
+    return _segments_text(result), time.perf_counter() - start
+
+
+def autotune(audio, model_name=transcription.MODEL_NAME, reference_text=None, candidates=None,
+             max_wer_drift=0.02, repeats=1, log=print):
+    """
+    Greedy coordinate search over the candidate settings.
+
+    Starting from the current defaults, each parameter in TUNING_ORDER is swept
+    while the others stay at their best value so far. A trial is only eligible
+    if its WER is at most `max_wer_drift` above the baseline (the defaults).
+
+    Args:
+        audio: 16kHz float32 calibration clip
+        model_name: Whisper model to tune for
+        reference_text: Reference transcript for the clip. Without one, the
+            float32 baseline output is used as the reference, so drift is
+            measured relative to it
+        candidates: Override for default_candidates()
+        max_wer_drift: Allowed WER increase over the baseline
+        repeats: Timed runs per trial; the fastest is kept
+
+    Returns:
+        (best settings dict, list of trial reports)
+    """
+    candidates = candidates or default_candidates()
+    audio_seconds = len(audio) / SAMPLE_RATE
+    models = {}
+    trials = []
+    cache = {}
+
+    def evaluate(settings):
+        key = tuple(sorted(settings.items()))
+        if key in cache:
+            return cache[key]
+        best_wall = float("inf")
+        for _ in range(repeats):
+            text, wall = run_trial(audio, settings, model_name, models)
+            best_wall = min(best_wall, wall)
+        report = dict(settings, seconds=round(best_wall, 3),
+                      rtf=round(audio_seconds / best_wall, 2) if best_wall > 0 else 0.0,
+                      wer=round(word_error_rate(reference_text, text), 4) if reference_text else None,
+                      text=text)
+        cache[key] = report
+        trials.append(report)
+        log(f"  {_describe(settings)}: {report['rtf']}x real time, WER {report['wer']}")
+        return report
+
+    best = {
+        "compute_type": transcription.COMPUTE_TYPE,
+        "batch_size": transcription.BATCH_SIZE,
+        "threads": max(candidates["threads"]),
+        "chunk_size": transcription.CHUNK_SIZE,
+        "vad_onset": transcription.VAD_ONSET,
+        "vad_offset": transcription.VAD_OFFSET,
+    }
+
+    log("Baseline:")
+    baseline = evaluate(best)
+    if reference_text is None:
+        reference_text = baseline["text"]
+        baseline["wer"] = 0.0
+    wer_limit = baseline["wer"] + max_wer_drift
+    best_report = baseline
+
+    for parameter in TUNING_ORDER:
+        log(f"Tuning {parameter}:")
+        for value in candidates[parameter]:
+            settings = dict(best)
+            if parameter == "vad":
+                settings["vad_onset"], settings["vad_offset"] = value
+            else:
+                settings[parameter] = value
+            report = evaluate(settings)
+            if report["wer"] <= wer_limit and report["seconds"] < best_report["seconds"]:
+                best, best_report = settings, report
+
+    for report in trials:
+        report.pop("text", None)
+    return best, trials
+
+
+def _describe(settings):
+    return ", ".join(f"{key}={value}" for key, value in settings.items())
@@ -0,0 +1,159 @@
+"""
+Confidence-driven model cascade.
+
+compare_model_speed.py shows large-v2 running several times slower than base
+or tiny on CPU. Most of a meeting is transcribed fine by the small model, so
+the cascade:
+
+1. transcribes and aligns the whole recording with a fast model
+2. marks segments whose mean word alignment score falls below a threshold,
+   and segments alignment couldn't score at all
+3. transcribes only those spans again with the large model and replaces the
+   fast model's segments there, unless the large model decodes nothing
+
+    python -m diarscription cascade meeting.wav --fast-model base --model large-v2 --output-dir out
+
+The report gives the share of the audio that was escalated, which is roughly
+the share of large-model cost paid.
+
+Only word scores drive escalation: the batched whisperx pipeline returns the
+text and times of each segment but not whisper's token log-probabilities.
+"""
+import time
+
+import numpy as np
+
+from . import profiling
+from . import transcription
+from .audio import SAMPLE_RATE
+
+FAST_MODEL = "base"
+
+# Mean word score (wav2vec2 alignment confidence) below which a segment is
+# escalated; large-v2 output of the reference samples sits around 0.6
+SCORE_THRESHOLD = 0.4
+
+# Escalated spans closer than this are sent to the large model as one window
+MERGE_GAP = 2.0
+PADDING = 0.5
+
+
+def segment_confidence(segment):
+    """
+    Mean word score of a segment, or None if none of its words has one. Words
+    alignment couldn't place (numbers, symbols) have no score.
+    """
+    scores = [word["score"] for word in segment.get("words", []) if "score" in word]
+    return float(np.mean(scores)) if scores else None
+
+
+def low_confidence_windows(segments, score_threshold=SCORE_THRESHOLD, merge_gap=MERGE_GAP, padding=PADDING):
+    """
+    Merge low-confidence segments into windows for the large model.
+
+    Returns:
+        List of {"start", "end", "span_start", "span_end", "segments"} dicts in
+        time order; start/end include the padding, span_start/span_end are the
+        low-confidence segments themselves
+    """
+    windows = []
+    for segment in sorted(segments, key=lambda segment: segment["start"]):
+        score = segment_confidence(segment)
+        low = score < score_threshold if score is not None else bool(segment.get("text", "").strip())
+        if not low:
+            continue
+        start = max(0.0, segment["start"] - padding)
+        end = segment["end"] + padding
+        if windows and start <= windows[-1]["end"] + merge_gap:
+            windows[-1]["end"] = max(windows[-1]["end"], end)
+            windows[-1]["span_end"] = max(windows[-1]["span_end"], segment["end"])
+            windows[-1]["segments"] += 1
+        else:
+            windows.append({"start": start, "end": end, "span_start": segment["start"], "span_end": segment["end"],
+                            "segments": 1})
+    return windows
+
+
+def splice(segments, windows, replacements, allow_delete=False):
+    """
+    Replace the segments in each window's unpadded span by that window's new
+    segments, clipped to the same span so that words decoded from the padding
+    (still held by the kept neighbours) don't appear twice.
+
+    A window where the large model decoded nothing inside the span keeps the
+    fast model's segments, unless allow_delete is set. Each window gets a
+    "replaced" flag.
+    """
+    replaced = set()
+    new = []
+    for window, new_segments in zip(windows, replacements):
+        span = {"start": window["span_start"], "end": window["span_end"]}
+        new_segments = transcription.clip_segments(new_segments, span["start"], span["end"])
+        window["replaced"] = bool(new_segments) or allow_delete
+        if not window["replaced"]:
+            continue
+        replaced.update(id(segment) for segment in transcription.window_segments(segments, span))
+        new += new_segments
+    kept = [segment for segment in segments if id(segment) not in replaced] + new
+    kept.sort(key=lambda segment: segment["start"])
+    return kept
+
+
+def transcribe_cascade(audio, fast_model, load_slow_model, device=transcription.DEVICE, fast_settings=None,
+                       slow_settings=None, score_threshold=SCORE_THRESHOLD, allow_delete=False, log=print):
+    """
+    Transcribe with the fast model, escalate low-confidence spans to the slow one.
+
+    Args:
+        audio: 16kHz float32 samples
+        fast_model: Loaded whisperx model for the first pass
+        load_slow_model: Callable returning the large whisperx model; it is
+            only called when something needs escalating
+        fast_settings, slow_settings: resolve_settings() output for each model
+        allow_delete: Drop the fast model's segments in a span even when the
+            large model decodes nothing there. Off by default, so an empty
+            re-transcription never deletes words
+
+    Returns:
+        (aligned whisperx result, report dict)
+    """
+    fast_settings = fast_settings or transcription.resolve_settings(FAST_MODEL)
+    slow_settings = slow_settings or transcription.resolve_settings()
+    duration = len(audio) / SAMPLE_RATE
+
+    start = time.perf_counter()
+    with profiling.span("cascade_fast"):
+        result = transcription.transcribe(fast_model, audio, batch_size=fast_settings["batch_size"],
+                                          chunk_size=fast_settings["chunk_size"])
+        result = transcription.align(result, audio, device=device)
+    fast_seconds = time.perf_counter() - start
+
+    windows = low_confidence_windows(result["segments"], score_threshold)
+    escalated = sum(min(window["end"], duration) - window["start"] for window in windows)
+    log(f"✓ fast pass: {len(result['segments'])} segments in {fast_seconds:.1f}s, "
+        f"{len(windows)} spans ({escalated:.1f}s) below threshold")
+
+    start = time.perf_counter()
+    if windows:
+        with profiling.span("cascade_escalate", items=len(windows)):
+            slow_model = load_slow_model()
+            replacements = transcription.transcribe_windows(slow_model, audio, windows, language=result.get("language"),
+                                                            device=device, batch_size=slow_settings["batch_size"],
+                                                            chunk_size=slow_settings["chunk_size"])
+            result["segments"] = splice(result["segments"], windows, replacements, allow_delete)
+            result["word_segments"] = [word for segment in result["segments"] for word in segment.get("words", [])]
+        for window in windows:
+            if not window["replaced"]:
+                log(f"  {window['start']:.1f}-{window['end']:.1f}s: large model decoded nothing, kept the fast pass")
+    slow_seconds = time.perf_counter() - start
+
+    report = {
+        "duration": duration,
+        "windows": windows,
+        "escalated_seconds": escalated,
+        "escalated_fraction": escalated / duration if duration else 0.0,
+        "kept_fast": sum(not window["replaced"] for window in windows),
+        "fast_seconds": fast_seconds,
+        "escalation_seconds": slow_seconds,
+    }
+    return result, report
@@ -0,0 +1,792 @@
+"""
+Command line entry point: one subcommand per pipeline stage.
+
+    python -m diarscription tokenize audio-b.txt -o incomplete_tokens_b.json
+    python -m diarscription merge incomplete_tokens_b.json formatted_srt.md -o completed_tokens_b.json
+    python -m diarscription export whisperx_output.json --output-dir out
+    python -m diarscription transcribe meeting.wav --output-dir out
+    python -m diarscription run meeting.mp3 --hf-token hf_xxx --output-dir out
+    python -m diarscription bench-imports
+
+Only argparse and the profiling module are imported up front. Each handler
+imports the stage modules it needs, and the stage modules import whisperx,
+torch, pyannote and tiktoken inside the functions that use them. Text-only
+commands (tokenize, merge, export) therefore never load torch.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from . import profiling
+
+# Modules each subcommand ends up importing, used by bench-imports
+STAGE_IMPORTS = {
+    "export": ["diarscription.export"],
+    "corpus": ["diarscription.corpus", "tiktoken"],
+    "merge": ["diarscription.tokens", "diarscription.export"],
+    "tokenize": ["diarscription.tokens", "tiktoken"],
+    "preprocess": ["diarscription.audio"],
+    "clips": ["diarscription.clips"],
+    "transcribe": ["diarscription.transcription", "whisperx"],
+    "diarize": ["diarscription.diarization", "whisperx"],
+    "separate": ["diarscription.diarization", "pyannote.audio"],
+    "check-separation": ["diarscription.consistency", "scipy.optimize"],
+    "run": ["diarscription.pipeline", "whisperx"],
+    "autotune": ["diarscription.autotune", "whisperx"],
+    "speakers": ["diarscription.speakers"],
+    "tail": ["diarscription.incremental", "whisperx"],
+    "repair": ["diarscription.repetition", "whisperx"],
+    "cascade": ["diarscription.cascade", "whisperx"],
+    "queue": ["diarscription.workqueue"],
+    "worker": ["diarscription.workqueue"],
+    "db": ["diarscription.store"],
+    "index": ["diarscription.search", "diarscription.corpus"],
+    "search": ["diarscription.search"],
+    "bench-denoise": ["diarscription.denoise"],
+}
+
+HEAVY_MODULES = ["torch", "whisper", "whisperx", "pyannote.audio", "sentence_transformers", "sklearn", "plotly"]
+
+
+def _read_json(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _stem(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def cmd_preprocess(args):
+    import shutil
+    from . import audio
+
+    temp_path = audio.preprocess_audio(args.input_file, denoise=args.denoise)
+    output = args.output or f"{_stem(args.input_file)}.wav"
+    shutil.move(temp_path, output)
+    print(f"✓ Wrote {output}")
+
+
+def cmd_transcribe(args):
+    from . import audio, transcription
+
+    samples = audio.load_audio(args.audio_file)
+    settings = transcription.resolve_settings(args.model, **_setting_overrides(args))
+    model = transcription.load_model(args.model, compute_type=settings["compute_type"],
+                                     vad_onset=settings["vad_onset"], vad_offset=settings["vad_offset"],
+                                     threads=settings["threads"])
+    result = transcription.transcribe(model, samples, batch_size=settings["batch_size"],
+                                      chunk_size=settings["chunk_size"])
+    if not args.no_align:
+        result = transcription.align(result, samples)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    output = os.path.join(args.output_dir, f"{_stem(args.audio_file)}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, default=float)
+    print(f"✓ {len(result['segments'])} segments -> {output}")
+
+
+def cmd_cascade(args):
+    from . import audio, cascade, transcription
+
+    samples = audio.load_audio(args.audio_file)
+    overrides = _setting_overrides(args)
+    fast_settings = transcription.resolve_settings(args.fast_model, **overrides)
+    slow_settings = transcription.resolve_settings(args.model, **overrides)
+
+    def load(model_name, settings):
+        return transcription.load_model(model_name, compute_type=settings["compute_type"],
+                                        vad_onset=settings["vad_onset"], vad_offset=settings["vad_offset"],
+                                        threads=settings["threads"])
+
+    result, report = cascade.transcribe_cascade(samples, load(args.fast_model, fast_settings),
+                                                lambda: load(args.model, slow_settings),
+                                                fast_settings=fast_settings, slow_settings=slow_settings,
+                                                score_threshold=args.threshold, allow_delete=args.allow_delete)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    output = os.path.join(args.output_dir, f"{_stem(args.audio_file)}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, default=float)
+    print(f"✓ {len(result['segments'])} segments -> {output}")
+    print(f"  {report['escalated_fraction']:.1%} of the audio escalated to {args.model} "
+          f"({report['fast_seconds']:.1f}s fast pass + {report['escalation_seconds']:.1f}s escalation)")
+    if report["kept_fast"]:
+        print(f"  {report['kept_fast']}/{len(report['windows'])} spans kept the fast pass ({args.model} decoded nothing)")
+
+
+def cmd_repair(args):
+    from . import audio, repetition, transcription
+
+    result = _read_json(args.whisperx_json)
+    windows = repetition.flag_windows(result["segments"])
+    print(f"{len(windows)} windows flagged")
+    if not windows or args.dry_run:
+        for window in windows:
+            print(f"  {window['start']:.1f}-{window['end']:.1f}s: {'; '.join(window['reasons'])}")
+        return
+
+    samples = audio.load_audio(args.audio_file)
+    retry_model = args.retry_model or args.model
+    settings = transcription.resolve_settings(retry_model, **_setting_overrides(args))
+    model = transcription.load_model(retry_model, compute_type=settings["compute_type"],
+                                     vad_onset=settings["vad_onset"], vad_offset=settings["vad_offset"],
+                                     threads=settings["threads"],
+                                     asr_options=dict(repetition.RETRY_ASR_OPTIONS, temperatures=args.temperatures))
+    aligned = any(segment.get("words") for segment in result["segments"])
+    repaired, report = repetition.repair(result, samples, model, batch_size=settings["batch_size"],
+                                         chunk_size=settings["chunk_size"], align=aligned,
+                                         allow_delete=args.allow_delete)
+
+    output = args.output or args.whisperx_json
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(repaired, f, default=float)
+    print(f"✓ {report['replaced']}/{len(windows)} windows replaced, "
+          f"{report['redecoded_seconds']:.1f}s re-decoded ({report['redecoded_fraction']:.1%} of the audio) -> {output}")
+
+
+def cmd_diarize(args):
+    from . import audio, diarization
+
+    if args.window:
+        from . import longform
+
+        turns, embeddings = longform.diarize_long(args.audio_file, args.hf_token, window=args.window,
+                                                  overlap=args.overlap, workers=args.workers,
+                                                  min_speakers=args.min_speakers, max_speakers=args.max_speakers)
+        diarize_segments = longform.to_dataframe(turns)
+    else:
+        samples = audio.load_audio(args.audio_file)
+        diarize_segments = diarization.diarize(samples, args.hf_token,
+                                               min_speakers=args.min_speakers, max_speakers=args.max_speakers,
+                                               return_embeddings=bool(args.registry))
+        if args.registry:
+            diarize_segments, embeddings = diarize_segments
+    identities = {}
+    if args.registry:
+        from .speakers import SpeakerRegistry
+
+        registry = SpeakerRegistry(args.registry)
+        identities = registry.label_meeting(embeddings, meeting=args.meeting or _stem(args.audio_file),
+                                            threshold=args.threshold)
+        registry.save()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    turns = []
+    for row in diarize_segments.to_dict("records"):
+        turn = {"start": row["start"], "end": row["end"], "speaker": row["speaker"]}
+        if row["speaker"] in identities:
+            turn["identity"] = identities[row["speaker"]]["name"]
+        turns.append(turn)
+    turns_path = os.path.join(args.output_dir, f"{_stem(args.audio_file)}.turns.json")
+    with open(turns_path, "w", encoding="utf-8") as f:
+        json.dump(turns, f, indent=2)
+    print(f"✓ {len(turns)} speaker turns -> {turns_path}")
+
+    for label, identity in sorted(identities.items()):
+        score = f"{identity['score']:.3f}" if identity["score"] is not None else "new"
+        print(f"  {label} -> {identity['name']} ({score})")
+
+    if args.whisperx_json:
+        result = diarization.assign_speakers(diarize_segments, _read_json(args.whisperx_json))
+        with open(args.whisperx_json, "w", encoding="utf-8") as f:
+            json.dump(result, f, default=float)
+        print(f"✓ Speakers assigned in {args.whisperx_json}")
+
+
+def cmd_speakers(args):
+    from .speakers import SpeakerRegistry
+
+    registry = SpeakerRegistry(args.registry)
+    if args.action == "rename":
+        if args.index is None or args.name is None:
+            raise SystemExit("speakers rename: needs an identity index and a name")
+        registry.rename(args.index, args.name)
+        registry.save()
+    for index, identity in enumerate(registry.identities):
+        print(f"{index:>5}  {identity['name']:<24} {len(identity['meetings']):>4} meetings")
+
+
+def cmd_separate(args):
+    from . import diarization
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    _, created_audio_files = diarization.separate_speakers(args.audio_file, args.hf_token, args.output_dir)
+    for filename in created_audio_files:
+        print(f"✓ {filename}")
+
+
+def cmd_check_separation(args):
+    from . import consistency
+
+    turns = consistency.read_turns(args.turns)
+    report = consistency.check(turns, consistency.find_sources(args.source_dir), min_iou=args.min_iou)
+    for speaker, source in sorted(report["assignment"].items()):
+        iou = report["iou"][report["speakers"].index(speaker)][report["sources"].index(source)]
+        print(f"  {speaker} <- {source}.wav (IoU {iou:.2f})")
+    for issue in report["issues"]:
+        print(f"✗ {issue['type']}: " + ", ".join(f"{key}={value}" for key, value in issue.items() if key != "type"))
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.relabel:
+        for old, new in consistency.relabel(report, args.source_dir):
+            print(f"✓ {old} -> {new}")
+    elif not report["issues"]:
+        print("✓ diarization and separated sources agree")
+
+
+def cmd_clips(args):
+    from . import audio, clips
+
+    if (args.turns is None) == (args.whisperx_json is None):
+        raise SystemExit("clips: give exactly one of --turns or --whisperx-json")
+    if args.turns:
+        utterances = clips.utterances_from_turns(_read_json(args.turns))
+    else:
+        utterances = clips.utterances_from_whisperx(_read_json(args.whisperx_json))
+
+    mapped = audio.open_mapped(args.audio_file)
+    temp_path = None
+    if mapped is None:
+        temp_path = audio.preprocess_audio(args.audio_file)
+        mapped = audio.open_mapped(temp_path)
+    try:
+        manifest = clips.extract_clips(mapped, utterances, args.output_dir, fmt=args.format, trim=args.trim,
+                                       normalize=args.normalize, padding=args.padding, workers=args.workers)
+    finally:
+        mapped.close()
+        if temp_path:
+            os.remove(temp_path)
+    print(f"✓ {len(manifest)} {args.format} clips -> {args.output_dir}")
+
+
+def cmd_tokenize(args):
+    from . import export, tokens
+
+    with open(args.text_file, "r", encoding="utf-8") as f:
+        text = f.read()
+    token_list = tokens.tokenize_text(text)
+    export.write_token_json(token_list, args.output)
+    print(f"✓ {len(token_list)} tokens -> {args.output}")
+
+
+def cmd_merge(args):
+    from . import export, tokens
+
+    token_list = _read_json(args.tokens_file)
+    with open(args.srt_file, "r", encoding="utf-8") as f:
+        speaker_segments = tokens.parse_srt_speakers(f.read())
+    completed_tokens = tokens.assign_speakers_to_tokens(token_list, speaker_segments)
+    export.write_token_json(completed_tokens, args.output)
+    print(f"✓ {len(completed_tokens)} tokens across {len(speaker_segments)} segments -> {args.output}")
+
+
+def cmd_corpus(args):
+    from . import corpus
+
+    root = args.root or corpus.DEFAULT_ROOT
+    sample_dirs = corpus.discover_samples(root)
+    if args.samples:
+        sample_dirs = [d for d in sample_dirs if corpus.sample_name(d) in args.samples]
+    print(f"Processing {len(sample_dirs)} samples from {root}")
+    summary = corpus.run_corpus(sample_dirs, args.output_dir, workers=args.workers)
+
+    print(f"\n✓ {summary['succeeded']} succeeded, {summary['failed']} failed on {summary['workers']} workers")
+    print(f"  {summary['tokens']} tokens in {summary['seconds']:.2f}s ({summary['tokens_per_second']:.0f} tokens/s)")
+    if args.summary:
+        with open(args.summary, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+    if summary["failed"]:
+        raise SystemExit(1)
+
+
+def cmd_export(args):
+    from . import export
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    if args.cache_dir:
+        # typed tables (and numpy) only pay off when a cached copy can be reused
+        from . import ingest
+
+        transcript = ingest.load_whisperx(args.whisperx_json, cache_dir=args.cache_dir)
+        token_array = transcript.token_array()
+        export.write_token_array(token_array, os.path.join(args.output_dir, "token_array.json"))
+        transcript.write_final_srt(os.path.join(args.output_dir, "final_transcript.srt"))
+    else:
+        whisperx_data = _read_json(args.whisperx_json)
+        token_array = export.create_token_array(whisperx_data)
+        export.write_token_array(token_array, os.path.join(args.output_dir, "token_array.json"))
+        export.create_final_srt_file(token_array, whisperx_data,
+                                     os.path.join(args.output_dir, "final_transcript.srt"))
+    print(f"✓ {len(token_array)} tokens -> {args.output_dir}")
+
+
+def cmd_queue(args):
+    from . import workqueue
+
+    queue = workqueue.WorkQueue(args.queue_dir)
+    if args.action == "enqueue":
+        if not args.inputs:
+            raise SystemExit("queue enqueue: give the input files (or sample directories for --kind tokens)")
+        options = json.loads(args.options) if args.options else {}
+        payloads = [{"input": os.path.abspath(path), "options": options} for path in args.inputs]
+        print(f"✓ {queue.enqueue(args.kind, payloads, max_attempts=args.max_attempts)} {args.kind} jobs queued")
+    elif args.action == "retry":
+        print(f"✓ {queue.retry_failed()} failed jobs re-queued")
+    elif args.action == "list":
+        for job in queue.jobs(args.state):
+            error = (job["error"] or "").splitlines()[:1]
+            print(f"{job['id']:>6}  {job['state']:<8} {job['kind']:<10} {job['attempts']}  "
+                  f"{job['worker'] or '':<24} {job['payload'].get('input', '')}  {''.join(error)}")
+    status = queue.status()
+    print("  " + ", ".join(f"{state}: {status.get(state, 0)}" for state in ("queued", "running", "done", "failed")))
+    queue.close()
+
+
+def cmd_worker(args):
+    from . import workqueue
+
+    done, failed = workqueue.run_worker(args.queue_dir, worker=args.name, lease=args.lease, poll=args.poll,
+                                        exit_when_empty=args.exit_when_empty, max_jobs=args.max_jobs)
+    print(f"✓ {done} jobs done, {failed} failed")
+
+
+def cmd_db(args):
+    from . import store
+
+    results = store.ResultsStore(args.database)
+    try:
+        if args.action == "load":
+            for sample_dir in args.inputs:
+                segments, words, turns = results.load_sample(sample_dir)
+                print(f"✓ {os.path.basename(os.path.normpath(sample_dir))}: "
+                      f"{segments} segments, {words} words, {turns} turns")
+        elif args.action == "talk-time":
+            for meeting, speaker, ms, count in results.talk_time(args.meeting, source=args.source):
+                print(f"{meeting:<24} {speaker or 'Unknown':<14} {ms / 1000:>9.1f}s  {count:>5} {args.source}")
+        elif args.action == "words":
+            if not args.meeting:
+                raise SystemExit("db words: needs --meeting")
+            start_ms = int((args.start or 0.0) * 1000)
+            end_ms = int(args.end * 1000) if args.end is not None else 2 ** 62
+            for start, end, speaker, text, score in results.words_between(args.meeting, start_ms, end_ms):
+                score = f"{score:.2f}" if score is not None else "-"
+                print(f"{start / 1000:>9.3f} {end / 1000:>9.3f}  {speaker or '':<12} {score:>5}  {text}")
+        elif args.action == "find":
+            if not args.inputs:
+                raise SystemExit("db find: needs a word")
+            for meeting, start, end, speaker, text in results.find(args.inputs[0], speaker=args.speaker):
+                print(f"{meeting:<24} {start}ms  {speaker or '':<12} {text}")
+        elif args.action == "meetings":
+            for meeting in results.meetings():
+                print(meeting)
+    finally:
+        results.close()
+
+
+def cmd_index(args):
+    from . import corpus, search
+
+    paths = args.whisperx_json or search.find_whisperx_files(args.root or corpus.DEFAULT_ROOT)
+    index = search.TranscriptIndex(args.index_dir)
+    words = index.add_files(paths)
+    print(f"✓ {words} words indexed, {len(index.meetings)} meetings in {args.index_dir}")
+    if args.optimize:
+        index.optimize()
+        print("✓ segments merged")
+
+
+def cmd_search(args):
+    from . import search
+
+    index = search.TranscriptIndex(args.index_dir)
+    hits = index.search(args.query, near=args.near, meetings=args.meeting, speakers=args.speaker,
+                        start_ms=None if args.start is None else int(args.start * 1000),
+                        end_ms=None if args.end is None else int(args.end * 1000))
+    if args.json:
+        print(json.dumps(hits, indent=2))
+        return
+    for hit in hits:
+        print(f"{hit['meeting']}  {hit['start_ms']}ms  {hit['speaker']}")
+    print(f"✓ {len(hits)} hits")
+
+
+def cmd_run(args):
+    from . import pipeline
+
+    pipeline.run(args.audio_file, args.output_dir, args.hf_token, model_name=args.model,
+                 min_speakers=args.min_speakers, max_speakers=args.max_speakers, registry=args.registry,
+                 repair=args.repair, fast_model=args.fast_model, denoise=args.denoise, **_setting_overrides(args))
+    print(f"✓ Done! Outputs in {args.output_dir}")
+
+
+def cmd_tail(args):
+    from . import incremental
+
+    models = {}  # loaded on the first update, reused by every later one
+    while True:
+        new_seconds = incremental.process_tail(args.audio_file, args.output_dir, args.hf_token,
+                                               model_name=args.model, models=models, overlap=args.overlap,
+                                               **_setting_overrides(args))
+        if new_seconds:
+            state = incremental.load_state(args.output_dir)
+            print(f"✓ +{new_seconds:.1f}s processed, stable up to {state['stable_until']:.1f}s")
+        if not args.watch:
+            break
+        time.sleep(args.watch)
+
+
+def cmd_autotune(args):
+    from . import audio, autotune
+
+    samples = audio.load_audio(args.audio_file)
+    start = int(args.clip_start * audio.SAMPLE_RATE)
+    clip = samples[start:start + int(args.clip_seconds * audio.SAMPLE_RATE)]
+
+    reference_text = None
+    if args.reference:
+        reference_text = autotune.read_reference_text(args.reference, args.clip_start,
+                                                      args.clip_start + args.clip_seconds)
+
+    print(f"Calibrating {args.model} on {len(clip) / audio.SAMPLE_RATE:.1f}s of {args.audio_file}")
+    best, trials = autotune.autotune(clip, args.model, reference_text=reference_text,
+                                     max_wer_drift=args.max_wer_drift, repeats=args.repeat)
+    path = autotune.save_host_profile(args.model, best, trials)
+    print(f"\n✓ Best settings for {autotune.host_key()}: {best}")
+    print(f"  Saved to {path}")
+
+
+def _time_imports(modules, repeat):
+    """
+    Import modules in a fresh interpreter and return (best import ms, best process ms,
+    heavy modules that got loaded) or an error string if an import failed.
+    """
+    code = (
+        "import importlib, sys, time\n"
+        "t = time.perf_counter()\n"
+        "import diarscription.cli\n"
+        f"for name in {modules!r}: importlib.import_module(name)\n"
+        "elapsed = time.perf_counter() - t\n"
+        f"print(elapsed, ','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))\n"
+    )
+    package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [package_root, os.environ.get("PYTHONPATH")])))
+    best_import = best_process = float("inf")
+    heavy = ""
+    for _ in range(repeat):
+        start = time.perf_counter()
+        proc = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=env)
+        process_ms = (time.perf_counter() - start) * 1000
+        if proc.returncode != 0:
+            return proc.stderr.strip().splitlines()[-1]
+        import_s, _, heavy = proc.stdout.strip().partition(" ")
+        best_import = min(best_import, float(import_s) * 1000)
+        best_process = min(best_process, process_ms)
+    return best_import, best_process, heavy
+
+
+def cmd_bench_denoise(args):
+    from . import audio, denoise
+
+    audio_file = args.audio_file
+    mapped = audio.open_mapped(audio_file)
+    if mapped is None:
+        audio_file = audio.preprocess_audio(args.audio_file)
+    else:
+        mapped.close()
+    try:
+        report = denoise.benchmark(audio_file, model_name=args.model, clip_seconds=args.clip_seconds,
+                                   transcribe=not args.no_transcribe, repeats=args.repeat,
+                                   **_setting_overrides(args))
+    finally:
+        if audio_file != args.audio_file:
+            os.remove(audio_file)
+    if "denoised" in report:
+        original, denoised = report["original"], report["denoised"]
+        print(f"  speech ratio   {original['speech_ratio']:.1%} -> {denoised['speech_ratio']:.1%}")
+        print(f"  transcription  {original['transcribe_seconds']:.1f}s -> {denoised['transcribe_seconds']:.1f}s")
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"✓ Report -> {args.report}")
+
+
+def cmd_bench_imports(args):
+    commands = args.commands or list(STAGE_IMPORTS)
+    unknown = [command for command in commands if command not in STAGE_IMPORTS]
+    if unknown:
+        raise SystemExit(f"bench-imports: unknown command(s): {', '.join(unknown)}")
+    print(f"{'command':<12} {'import ms':>10} {'process ms':>11}  heavy modules loaded")
+    for command in commands:
+        result = _time_imports(STAGE_IMPORTS[command], args.repeat)
+        if isinstance(result, str):
+            print(f"{command:<12} {'-':>10} {'-':>11}  failed: {result}")
+            continue
+        import_ms, process_ms, heavy = result
+        print(f"{command:<12} {import_ms:>10.1f} {process_ms:>11.1f}  {heavy or '-'}")
+
+
+def _setting_overrides(args):
+    return {
+        "compute_type": args.compute_type,
+        "batch_size": args.batch_size,
+        "threads": args.threads,
+        "chunk_size": args.chunk_size,
+        "vad_onset": args.vad_onset,
+        "vad_offset": args.vad_offset,
+    }
+
+
+def _add_model_arguments(parser):
+    from .transcription import MODEL_NAME
+
+    # Left as None so the autotuned profile (or the module default) applies unless given
+    parser.add_argument("--model", default=MODEL_NAME)
+    parser.add_argument("--compute-type", choices=["float32", "float16", "int8"])
+    parser.add_argument("--batch-size", type=int)
+    parser.add_argument("--threads", type=int)
+    parser.add_argument("--chunk-size", type=int)
+    parser.add_argument("--vad-onset", type=float)
+    parser.add_argument("--vad-offset", type=float)
+
+
+def _add_speaker_arguments(parser):
+    parser.add_argument("--hf-token", default=os.environ.get("HF_TOKEN"))
+    parser.add_argument("--min-speakers", type=int)
+    parser.add_argument("--max-speakers", type=int)
+
+
+def build_parser():
+    from .transcription import MODEL_NAME
+
+    # Options every subcommand accepts
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--profile", metavar="DIR",
+                        help="record profiling spans and write profile.trace.json / profile.summary.json to DIR")
+
+    parser = argparse.ArgumentParser(prog="diarscription", description="Speaker-attributed meeting transcription.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def add_command(name, help):
+        return sub.add_parser(name, help=help, parents=[common])
+
+    p = add_command("preprocess", "convert any audio file to 16kHz mono WAV")
+    p.add_argument("input_file")
+    p.add_argument("-o", "--output")
+    p.add_argument("--denoise", action="store_true", help="gate out stationary background noise (see denoise.py)")
+    p.set_defaults(func=cmd_preprocess)
+
+    p = add_command("transcribe", "VAD + Whisper transcription with word alignment")
+    p.add_argument("audio_file")
+    p.add_argument("--output-dir", default=".")
+    p.add_argument("--no-align", action="store_true")
+    _add_model_arguments(p)
+    p.set_defaults(func=cmd_transcribe)
+
+    p = add_command("cascade", "transcribe with a fast model, re-transcribe low-confidence spans with --model")
+    p.add_argument("audio_file")
+    p.add_argument("--output-dir", default=".")
+    p.add_argument("--fast-model", default="base")
+    p.add_argument("--threshold", type=float, default=0.4, help="mean word score below which a segment is escalated")
+    p.add_argument("--allow-delete", action="store_true",
+                   help="drop a span's fast-pass segments even when --model decodes nothing there")
+    _add_model_arguments(p)
+    p.set_defaults(func=cmd_cascade)
+
+    p = add_command("repair", "re-decode the windows of a transcript where whisper looped or hallucinated")
+    p.add_argument("audio_file")
+    p.add_argument("whisperx_json")
+    p.add_argument("-o", "--output", help="default: rewrite whisperx_json in place")
+    p.add_argument("--retry-model", help="model for the re-decode (default: --model)")
+    p.add_argument("--temperatures", type=float, nargs="+", default=[0.2, 0.4, 0.6, 0.8],
+                   help="sampling temperatures for the re-decode")
+    p.add_argument("--dry-run", action="store_true", help="only list the flagged windows")
+    p.add_argument("--allow-delete", action="store_true",
+                   help="accept a retry that decodes nothing, deleting the window's original segments")
+    _add_model_arguments(p)
+    p.set_defaults(func=cmd_repair)
+
+    p = add_command("diarize", "pyannote speaker diarization")
+    p.add_argument("audio_file")
+    p.add_argument("--output-dir", default=".")
+    p.add_argument("--whisperx-json", help="assign speakers to the words in this whisperx JSON (rewritten in place)")
+    p.add_argument("--registry", help="speaker registry directory; map labels to cross-meeting identities")
+    p.add_argument("--meeting", help="meeting name stored in the registry (default: file name)")
+    p.add_argument("--threshold", type=float, default=0.6, help="cosine similarity needed to reuse an identity")
+    p.add_argument("--window", type=float,
+                   help="diarize in windows of this many seconds and stitch speakers across them (long recordings)")
+    p.add_argument("--overlap", type=float, default=30.0, help="seconds shared by neighbouring windows")
+    p.add_argument("--workers", type=int, help="worker processes for --window (default: cores / 4)")
+    _add_speaker_arguments(p)
+    p.set_defaults(func=cmd_diarize)
+
+    p = add_command("speakers", "list or rename identities in a speaker registry")
+    p.add_argument("registry")
+    p.add_argument("action", nargs="?", choices=["list", "rename"], default="list")
+    p.add_argument("index", nargs="?", type=int)
+    p.add_argument("name", nargs="?")
+    p.set_defaults(func=cmd_speakers)
+
+    p = add_command("separate", "pyannote.ami speech separation, one WAV per speaker")
+    p.add_argument("audio_file")
+    p.add_argument("--output-dir", default=".")
+    p.add_argument("--hf-token", default=os.environ.get("HF_TOKEN"))
+    p.set_defaults(func=cmd_separate)
+
+    p = add_command("check-separation", "match diarization speakers to separated source WAVs")
+    p.add_argument("turns", help="turns JSON written by diarize, or the audio.rttm written by separate")
+    p.add_argument("source_dir", help="directory with the SPEAKER_XX.wav files")
+    p.add_argument("--min-iou", type=float, default=0.2, help="report matches weaker than this")
+    p.add_argument("--relabel", action="store_true", help="rename source files to the speaker they match")
+    p.add_argument("--report", help="write the full report (IoU matrix, assignment, issues) as JSON")
+    p.set_defaults(func=cmd_check_separation)
+
+    p = add_command("clips", "cut one audio clip per diarization turn or transcript cue")
+    p.add_argument("audio_file", help="preprocessed 16kHz WAV (other files are preprocessed first)")
+    p.add_argument("--turns", help="turns JSON written by diarize")
+    p.add_argument("--whisperx-json", help="whisperx JSON; one clip per segment")
+    p.add_argument("--output-dir", default="clips")
+    p.add_argument("--format", choices=["wav", "flac", "mp3"], default="wav")
+    p.add_argument("--trim", action="store_true", help="cut leading/trailing silence")
+    p.add_argument("--normalize", action="store_true", help="peak-normalize each clip")
+    p.add_argument("--padding", type=float, default=0.0, help="seconds added around each utterance")
+    p.add_argument("--workers", type=int, help="encoder threads (default: all cores)")
+    p.set_defaults(func=cmd_clips)
+
+    p = add_command("tokenize", "split a stripped transcript into tiktoken tokens")
+    p.add_argument("text_file")
+    p.add_argument("-o", "--output", required=True)
+    p.set_defaults(func=cmd_tokenize)
+
+    p = add_command("merge", "assign speakers and times to tokens from a formatted SRT")
+    p.add_argument("tokens_file")
+    p.add_argument("srt_file")
+    p.add_argument("-o", "--output", required=True)
+    p.set_defaults(func=cmd_merge)
+
+    p = add_command("corpus", "tokenize, merge and export every reference sample in parallel")
+    p.add_argument("--root", help="directory holding the sample-* directories (default: the package's "
+                                  "docs/reference/audio, wherever it is run from)")
+    p.add_argument("--output-dir", default="tokens")
+    p.add_argument("--workers", type=int, help="worker processes (default: all cores)")
+    p.add_argument("--samples", nargs="*", help="only these samples, e.g. a b c")
+    p.add_argument("--summary", help="write the run summary as JSON")
+    p.set_defaults(func=cmd_corpus)
+
+    p = add_command("export", "write token_array.json and final_transcript.srt from whisperx JSON")
+    p.add_argument("whisperx_json")
+    p.add_argument("--output-dir", default=".")
+    p.add_argument("--cache-dir", help="load through typed tables and keep an .npz copy here for faster reloads")
+    p.set_defaults(func=cmd_export)
+
+    p = add_command("queue", "enqueue jobs into, or inspect, a shared work queue directory")
+    p.add_argument("queue_dir")
+    p.add_argument("action", choices=["status", "enqueue", "list", "retry"])
+    p.add_argument("inputs", nargs="*")
+    p.add_argument("--kind", choices=["run", "transcribe", "export", "tokens"], default="run")
+    p.add_argument("--options", help='JSON keyword arguments for the job, e.g. \'{"model_name": "base"}\'')
+    p.add_argument("--max-attempts", type=int, default=3)
+    p.add_argument("--state", choices=["queued", "running", "done", "failed"], help="list only jobs in this state")
+    p.set_defaults(func=cmd_queue)
+
+    p = add_command("worker", "claim and run jobs from a shared work queue directory")
+    p.add_argument("queue_dir")
+    p.add_argument("--name", help="worker name in the queue (default: host:pid)")
+    p.add_argument("--lease", type=float, default=120.0, help="seconds a claim stays valid without a heartbeat")
+    p.add_argument("--poll", type=float, default=2.0, help="seconds between claims while the queue is empty")
+    p.add_argument("--exit-when-empty", action="store_true")
+    p.add_argument("--max-jobs", type=int)
+    p.set_defaults(func=cmd_worker)
+
+    p = add_command("db", "load meetings into, or query, an SQLite results store")
+    p.add_argument("database")
+    p.add_argument("action", choices=["load", "meetings", "talk-time", "words", "find"])
+    p.add_argument("inputs", nargs="*", help="load: meeting directories (with whisperx/); find: the word")
+    p.add_argument("--meeting")
+    p.add_argument("--speaker")
+    p.add_argument("--start", type=float, help="seconds")
+    p.add_argument("--end", type=float, help="seconds")
+    p.add_argument("--source", choices=["turns", "segments"], default="turns", help="talk-time: what to sum")
+    p.set_defaults(func=cmd_db)
+
+    p = add_command("index", "add whisperx JSON files to a positional search index")
+    p.add_argument("index_dir")
+    p.add_argument("whisperx_json", nargs="*", help="default: every whisperx JSON under --root")
+    p.add_argument("--root", help="directory holding the sample-* directories (default: the package's "
+                                  "docs/reference/audio, wherever it is run from)")
+    p.add_argument("--optimize", action="store_true", help="merge the index segments into one afterwards")
+    p.set_defaults(func=cmd_index)
+
+    p = add_command("search", "phrase or proximity search over an index, with word timestamps")
+    p.add_argument("index_dir")
+    p.add_argument("query")
+    p.add_argument("--near", type=int, metavar="K", help="match the words in any order within K words")
+    p.add_argument("--speaker", nargs="*", help="only these speakers")
+    p.add_argument("--meeting", nargs="*", help="only these meetings")
+    p.add_argument("--start", type=float, help="seconds")
+    p.add_argument("--end", type=float, help="seconds")
+    p.add_argument("--json", action="store_true", help="print the hits as JSON")
+    p.set_defaults(func=cmd_search)
+
+    p = add_command("run", "full pipeline on one recording")
+    p.add_argument("audio_file")
+    p.add_argument("--output-dir", default=".")
+    p.add_argument("--registry", help="speaker registry directory; map labels to cross-meeting identities")
+    p.add_argument("--repair", action="store_true", help="re-decode windows where whisper looped before diarizing")
+    p.add_argument("--fast-model", help="cascade: transcribe with this model, escalate low-confidence spans to --model")
+    p.add_argument("--denoise", action="store_true", help="gate out stationary background noise before VAD")
+    _add_model_arguments(p)
+    _add_speaker_arguments(p)
+    p.set_defaults(func=cmd_run)
+
+    p = add_command("tail", "process only the new audio of a recording that keeps growing")
+    p.add_argument("audio_file")
+    p.add_argument("--output-dir", default=".")
+    p.add_argument("--hf-token", default=os.environ.get("HF_TOKEN"), help="needed to assign speakers")
+    p.add_argument("--overlap", type=float, default=5.0, help="seconds re-decoded before the last stable segment")
+    p.add_argument("--watch", type=float, metavar="SECONDS", help="keep polling the file every SECONDS")
+    _add_model_arguments(p)
+    p.set_defaults(func=cmd_tail)
+
+    p = add_command("autotune", "find the fastest CPU settings for this host and save them")
+    p.add_argument("audio_file", help="calibration recording")
+    p.add_argument("--model", default=MODEL_NAME)
+    p.add_argument("--reference", help="reference transcript (gold-reference.md, formatted_srt.md or plain text)")
+    p.add_argument("--clip-start", type=float, default=0.0, help="seconds")
+    p.add_argument("--clip-seconds", type=float, default=60.0)
+    p.add_argument("--max-wer-drift", type=float, default=0.02, help="allowed WER increase over the baseline")
+    p.add_argument("--repeat", type=int, default=1, help="timed runs per candidate")
+    p.set_defaults(func=cmd_autotune)
+
+    p = add_command("bench-denoise", "VAD speech ratio and transcription time with and without denoising")
+    p.add_argument("audio_file")
+    p.add_argument("--clip-seconds", type=float, help="only use the start of the recording")
+    p.add_argument("--no-transcribe", action="store_true", help="only time the denoise pass")
+    p.add_argument("--repeat", type=int, default=2, help="timed runs per version, in alternating order")
+    p.add_argument("--report", help="write the measurements to this JSON file")
+    _add_model_arguments(p)
+    p.set_defaults(func=cmd_bench_denoise)
+
+    p = add_command("bench-imports", "time how long each subcommand takes to import in a fresh interpreter")
+    p.add_argument("commands", nargs="*", metavar="command", help="subcommands to time (default: all)")
+    p.add_argument("--repeat", type=int, default=5)
+    p.set_defaults(func=cmd_bench_imports)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    if args.profile:
+        profiling.enable()
+
+    args.func(args)
+
+    if args.profile:
+        print(profiling.dump(args.profile))
@@ -0,0 +1,201 @@
+"""
+Per-utterance clip extraction (topic 7 of diarscription_topics.md).
+
+Cuts one clip per diarization turn or transcript cue out of the preprocessed
+audio, optionally trims silence and peak-normalizes, and encodes the clips to
+WAV, FLAC or MP3:
+
+    python -m diarscription clips meeting.wav --turns out/meeting.turns.json --output-dir clips --format flac --trim --normalize
+
+Clips are cut from a MappedAudio view of the recording and processed in
+batches. Within a batch, trimming and normalizing run as a few NumPy
+reductions over all clips at once (reduceat over the concatenated samples)
+instead of a Python loop per clip. Encoding runs on a thread pool. WAV, and
+FLAC/MP3 through soundfile, are encoded in-process; without soundfile, each
+FLAC/MP3 clip costs one ffmpeg process.
+"""
+import json
+import os
+import re
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from . import profiling
+from .audio import SAMPLE_RATE
+from .mapped_audio import to_float32, to_int16, write_wav
+
+FORMATS = ("wav", "flac", "mp3")
+BATCH_SIZE = 256
+
+# Trimming works on 10ms frames; frames more than TRIM_DB below the clip's
+# loudest frame count as silence
+TRIM_FRAME = SAMPLE_RATE // 100
+TRIM_DB = 40.0
+NORMALIZE_PEAK = 0.89  # about -1 dBFS
+
+UNSAFE_NAME = re.compile(r"[^\w-]+")
+
+
+def utterances_from_turns(turns):
+    """Diarization turns ({start, end, speaker}) -> utterance list."""
+    return [{"start": turn["start"], "end": turn["end"], "speaker": turn.get("identity") or turn["speaker"]}
+            for turn in turns]
+
+
+def utterances_from_whisperx(whisperx_data):
+    """Transcript cues (whisperx segments) -> utterance list, keeping the text."""
+    return [{"start": segment["start"], "end": segment["end"],
+             "speaker": segment.get("speaker", "Unknown"), "text": segment.get("text", "").strip()}
+            for segment in whisperx_data["segments"] if "start" in segment and "end" in segment]
+
+
+def trim_and_normalize(flat, lengths, trim=True, normalize=True, trim_db=TRIM_DB, peak=NORMALIZE_PEAK):
+    """
+    Trim leading/trailing silence from, and peak-normalize, a batch of clips
+    stored back to back in one float32 array.
+
+    Args:
+        flat: All clips concatenated (float32; normalized in place)
+        lengths: Length of each clip in samples (all > 0)
+
+    Returns:
+        (start, end) sample offsets of each trimmed clip within flat
+    """
+    offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    starts = offsets.copy()
+    ends = offsets + lengths
+
+    if trim:
+        # Frame grid per clip: the last frame of a clip may be shorter
+        frame_counts = -(-lengths // TRIM_FRAME)
+        frame_clip = np.repeat(np.arange(len(lengths)), frame_counts)
+        frame_index = np.arange(frame_counts.sum()) - np.repeat(np.cumsum(frame_counts) - frame_counts, frame_counts)
+        frame_starts = offsets[frame_clip] + frame_index * TRIM_FRAME
+
+        energy = np.add.reduceat(flat * flat, frame_starts)
+        clip_max = np.maximum.reduceat(energy, np.cumsum(frame_counts) - frame_counts)
+        active = energy > clip_max[frame_clip] * 10 ** (-trim_db / 10)
+
+        big = np.iinfo(np.int64).max
+        first = np.minimum.reduceat(np.where(active, frame_index, big), np.cumsum(frame_counts) - frame_counts)
+        last = np.maximum.reduceat(np.where(active, frame_index, -1), np.cumsum(frame_counts) - frame_counts)
+        silent = last < 0  # all-zero clip: leave it alone
+        starts = np.where(silent, starts, offsets + first * TRIM_FRAME)
+        ends = np.where(silent, ends, np.minimum(offsets + (last + 1) * TRIM_FRAME, offsets + lengths))
+
+    if normalize:
+        peaks = np.maximum.reduceat(np.abs(flat), offsets)
+        gains = np.where(peaks > 0, peak / np.maximum(peaks, 1e-12), 1.0).astype(np.float32)
+        flat *= np.repeat(gains, lengths)
+
+    return starts, ends
+
+
+def _safe_name(text):
+    """Speaker labels can be registry identity names; keep only characters safe in a file name."""
+    return UNSAFE_NAME.sub("_", str(text)).strip("_") or "unknown"
+
+
+class _Encoder:
+    """
+    Encoder state per worker thread (format probing, ffmpeg path). WAV is
+    written directly; FLAC and MP3 go through soundfile (libsndfile) when it
+    is installed, else through one ffmpeg run per clip.
+    """
+    def __init__(self, fmt, sample_rate):
+        self.fmt = fmt
+        self.sample_rate = sample_rate
+        self.soundfile = None
+        self.ffmpeg_path = None
+        if fmt != "wav":
+            try:
+                import soundfile
+                if fmt.upper() in soundfile.available_formats():  # MP3 needs libsndfile >= 1.1
+                    self.soundfile = soundfile
+            except ImportError:
+                pass
+            if self.soundfile is None:
+                from .audio import setup_ffmpeg
+                self.ffmpeg_path = setup_ffmpeg()
+
+    def encode(self, path, samples):
+        if self.fmt == "wav":
+            write_wav(path, samples, self.sample_rate)
+        elif self.soundfile is not None:
+            self.soundfile.write(path, samples, self.sample_rate, format=self.fmt.upper())
+        else:
+            subprocess.run([self.ffmpeg_path, "-nostdin", "-loglevel", "error", "-f", "s16le", "-ar",
+                            str(self.sample_rate), "-ac", "1", "-i", "-", "-y", path],
+                           input=to_int16(samples).tobytes(), check=True)
+
+
+def extract_clips(audio, utterances, output_dir, fmt="wav", trim=False, normalize=False, padding=0.0,
+                  workers=None, batch_size=BATCH_SIZE, log=print):
+    """
+    Cut, clean up and encode one clip per utterance.
+
+    Args:
+        audio: MappedAudio of the preprocessed recording
+        utterances: Dicts with start, end (seconds), speaker and optional text
+        output_dir: Where the clips and clips.json go
+        fmt: "wav", "flac" or "mp3"
+        trim: Cut leading/trailing silence
+        normalize: Peak-normalize each clip
+        padding: Seconds added before and after each utterance
+        workers: Encoder threads (default: all cores)
+
+    Returns:
+        Manifest list, one entry per written clip
+    """
+    if fmt not in FORMATS:
+        raise Exception(f"Unsupported clip format {fmt!r}, expected one of {FORMATS}")
+    os.makedirs(output_dir, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+
+    local = threading.local()
+
+    def encode(path, samples):
+        encoder = getattr(local, "encoder", None)
+        if encoder is None:
+            encoder = local.encoder = _Encoder(fmt, audio.sample_rate)
+        encoder.encode(path, samples)
+
+    manifest = []
+    with profiling.span("clips", items=len(utterances)), ThreadPoolExecutor(max_workers=workers) as pool:
+        for first in range(0, len(utterances), batch_size):
+            batch = []
+            for index, utterance in enumerate(utterances[first:first + batch_size], first):
+                view = audio.view(utterance["start"] - padding, utterance["end"] + padding, 0)
+                if len(view):
+                    batch.append((index, utterance, view))
+            if not batch:
+                continue
+
+            with profiling.span("clip_batch", category="loop", items=len(batch)):
+                lengths = np.array([len(view) for _, _, view in batch], dtype=np.int64)
+                offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+                flat = np.empty(lengths.sum(), dtype=np.float32)
+                for offset, (_, _, view) in zip(offsets, batch):
+                    # the one copy per clip: the mapped view into its slot of the batch buffer
+                    flat[offset:offset + len(view)] = view if audio.dtype == np.int16 else to_float32(view)
+                if audio.dtype == np.int16:
+                    flat *= 1.0 / 32768.0
+                starts, ends = trim_and_normalize(flat, lengths, trim=trim, normalize=normalize)
+
+                futures = []
+                for (index, utterance, _), offset, start, end in zip(batch, offsets, starts, ends):
+                    clip_start = max(0.0, utterance["start"] - padding) + (start - offset) / audio.sample_rate
+                    name = f"{index:05d}_{_safe_name(utterance['speaker'])}_{int(utterance['start'] * 1000)}.{fmt}"
+                    futures.append(pool.submit(encode, os.path.join(output_dir, name), flat[start:end]))
+                    manifest.append(dict(utterance, file=name, clip_start=round(clip_start, 3),
+                                         clip_end=round(clip_start + (end - start) / audio.sample_rate, 3)))
+                for future in futures:
+                    future.result()
+            log(f"✓ {len(manifest)}/{len(utterances)} clips")
+
+    with open(os.path.join(output_dir, "clips.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
@@ -0,0 +1,206 @@
+"""
+Consistency check between diarization and speech separation.
+
+`separate` writes one SPEAKER_XX.wav per source. Nothing guarantees that
+source k carries the voice diarization calls SPEAKER_k, or that every source
+contains any speech at all. This stage checks both before the per-speaker
+whisperx runs are spent on the files:
+
+1. frame-level activity matrices: diarization turns on one side, thresholded
+   energy envelopes of the separated sources on the other (FRAME seconds per frame)
+2. a speaker x source overlap matrix in one matrix product, normalized to IoU
+3. the best one-to-one assignment (Hungarian algorithm, scipy's linear_sum_assignment)
+4. flags: silent sources, sources assigned to a different label than their
+   file name, weak matches and speakers or sources left without a partner
+
+    python -m diarscription check-separation sources/audio.rttm sources/ --relabel
+
+With --relabel, mismatched source files are renamed to the speaker they
+match. Silent sources get a .silent.wav suffix, and unmatched sources in the
+way of a rename get .unmatched.wav, so that SPEAKER_*.wav globs skip both.
+"""
+import glob
+import json
+import os
+
+import numpy as np
+
+from . import profiling
+from .mapped_audio import MappedAudio
+
+FRAME = 0.05
+
+# A source frame is active when its energy is within ACTIVE_DB of the source's
+# loud frames (95th percentile) and above FLOOR_DB dBFS
+ACTIVE_DB = 30.0
+FLOOR_DB = -60.0
+
+# Less active speech than this makes a source "silent"
+MIN_ACTIVE_SECONDS = 1.0
+
+# Assignments below this IoU are reported as weak
+MIN_IOU = 0.2
+
+BLOCK_SECONDS = 60.0
+
+
+def read_turns(path):
+    """Speaker turns from a turns JSON (written by diarize) or an RTTM file."""
+    if path.endswith(".json"):
+        with open(path, "r", encoding="utf-8") as f:
+            return [{"start": turn["start"], "end": turn["end"], "speaker": turn["speaker"]} for turn in json.load(f)]
+    turns = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) >= 8 and fields[0] == "SPEAKER":
+                start, duration = float(fields[3]), float(fields[4])
+                turns.append({"start": start, "end": start + duration, "speaker": fields[7]})
+    return turns
+
+
+def turn_activity(turns, labels, frames, frame=FRAME):
+    """
+    speakers x frames boolean matrix from turns, built with one scatter of
+    +1/-1 edges and a cumulative sum instead of a loop over frames.
+    """
+    index = {label: i for i, label in enumerate(labels)}
+    edges = np.zeros((len(labels), frames + 1), dtype=np.int32)
+    if turns:
+        rows = np.array([index[turn["speaker"]] for turn in turns])
+        starts = np.clip(np.floor(np.array([turn["start"] for turn in turns]) / frame).astype(int), 0, frames)
+        ends = np.clip(np.ceil(np.array([turn["end"] for turn in turns]) / frame).astype(int), 0, frames)
+        np.add.at(edges, (rows, starts), 1)
+        np.add.at(edges, (rows, ends), -1)
+    return np.cumsum(edges, axis=1)[:, :frames] > 0
+
+
+def frame_energy_db(audio, frame=FRAME, block_seconds=BLOCK_SECONDS):
+    """
+    Per-frame energy (dBFS) of a MappedAudio, read one block at a time so
+    memory stays bounded by the block size.
+    """
+    hop = int(round(frame * audio.sample_rate))
+    block = max(1, int(block_seconds / frame)) * frame
+    energies = []
+    for _, samples in audio.windows(block):
+        usable = len(samples) // hop * hop
+        if usable:
+            energies.append(np.mean(np.square(samples[:usable].reshape(-1, hop), dtype=np.float64), axis=1))
+        if len(samples) > usable:
+            energies.append(np.array([np.mean(np.square(samples[usable:], dtype=np.float64))]))
+    energy = np.concatenate(energies) if energies else np.zeros(0)
+    return 10 * np.log10(energy + 1e-12)
+
+
+def source_activity(energy_db, active_db=ACTIVE_DB, floor_db=FLOOR_DB):
+    if not len(energy_db):
+        return np.zeros(0, dtype=bool)
+    return (energy_db > np.percentile(energy_db, 95) - active_db) & (energy_db > floor_db)
+
+
+def check(turns, source_files, frame=FRAME, min_iou=MIN_IOU, min_active_seconds=MIN_ACTIVE_SECONDS):
+    """
+    Match diarization speakers to separated sources.
+
+    Args:
+        turns: {start, end, speaker} dicts, seconds
+        source_files: Separated source WAVs; a file's label is its name without .wav
+
+    Returns:
+        Report dict: speakers, sources, the IoU matrix, the assignment
+        ({speaker: source label}) and a list of issues
+    """
+    from scipy.optimize import linear_sum_assignment
+
+    speakers = sorted({turn["speaker"] for turn in turns})
+    sources = [os.path.splitext(os.path.basename(path))[0] for path in source_files]
+
+    with profiling.span("check_separation", items=len(source_files)):
+        envelopes = []
+        for path in source_files:
+            audio = MappedAudio(path)
+            envelopes.append(source_activity(frame_energy_db(audio, frame)))
+            audio.close()
+        frames = max([len(envelope) for envelope in envelopes] +
+                     [int(np.ceil(max((turn["end"] for turn in turns), default=0.0) / frame))])
+
+        source_active = np.zeros((len(sources), frames), dtype=bool)
+        for i, envelope in enumerate(envelopes):
+            source_active[i, :len(envelope)] = envelope
+        speaker_active = turn_activity(turns, speakers, frames, frame)
+
+        # speakers x sources in one product; IoU = overlap / union
+        overlap = speaker_active.astype(np.float32) @ source_active.T.astype(np.float32)
+        union = speaker_active.sum(axis=1)[:, None] + source_active.sum(axis=1)[None, :] - overlap
+        iou = np.where(union > 0, overlap / np.maximum(union, 1), 0.0)
+
+        active_seconds = source_active.sum(axis=1) * frame
+        silent = active_seconds < min_active_seconds
+        rows, cols = linear_sum_assignment(np.where(silent[None, :], -1.0, iou), maximize=True)
+
+    issues = []
+    assignment = {}
+    for row, col in zip(rows, cols):
+        if silent[col] or iou[row, col] <= 0:
+            continue
+        speaker, source = speakers[row], sources[col]
+        assignment[speaker] = source
+        if iou[row, col] < min_iou:
+            issues.append({"type": "weak", "speaker": speaker, "source": source, "iou": float(iou[row, col])})
+        if source != speaker:
+            issues.append({"type": "mismatch", "speaker": speaker, "source": source, "iou": float(iou[row, col])})
+    for col in np.flatnonzero(silent):
+        issues.append({"type": "silent", "source": sources[col], "active_seconds": float(active_seconds[col])})
+    matched_sources = set(assignment.values())
+    for speaker in speakers:
+        if speaker not in assignment:
+            issues.append({"type": "unmatched_speaker", "speaker": speaker})
+    for col, source in enumerate(sources):
+        if not silent[col] and source not in matched_sources:
+            issues.append({"type": "unmatched_source", "source": source})
+
+    return {
+        "frame": frame,
+        "speakers": speakers,
+        "sources": sources,
+        "iou": iou.round(4).tolist(),
+        "active_seconds": active_seconds.tolist(),
+        "assignment": assignment,
+        "issues": issues,
+    }
+
+
+def relabel(report, source_dir):
+    """
+    Rename source files to the speaker they were matched with and mark silent
+    ones as <label>.silent.wav. Renames go through temporary names, so swaps
+    (SPEAKER_01 <-> SPEAKER_02) work.
+
+    Returns:
+        List of (old name, new name)
+    """
+    renames = {}
+    for speaker, source in report["assignment"].items():
+        if speaker != source:
+            renames[f"{source}.wav"] = f"{speaker}.wav"
+    for issue in report["issues"]:
+        if issue["type"] == "silent":
+            renames[f"{issue['source']}.wav"] = f"{issue['source']}.silent.wav"
+    # an unmatched source sitting on a name another file is taking moves aside
+    for new in list(renames.values()):
+        if new not in renames and os.path.exists(os.path.join(source_dir, new)):
+            renames[new] = new[:-len(".wav")] + ".unmatched.wav"
+
+    temporary = {}
+    for old in renames:
+        temporary[old] = f".{old}.relabel"
+        os.replace(os.path.join(source_dir, old), os.path.join(source_dir, temporary[old]))
+    for old, new in renames.items():
+        os.replace(os.path.join(source_dir, temporary[old]), os.path.join(source_dir, new))
+    return sorted(renames.items())
+
+
+def find_sources(source_dir):
+    return sorted(path for path in glob.glob(os.path.join(source_dir, "*.wav"))
+                  if not path.endswith((".silent.wav", ".unmatched.wav")))
@@ -0,0 +1,129 @@
+"""
+Parallel runner for the token stages over the whole reference corpus.
+
+Finds every sample directory under docs/reference/audio/ that has a
+formatted_srt.md and runs tokenize -> merge -> export for each one in a
+process pool:
+
+    python -m diarscription corpus --output-dir tokens --workers 8
+
+Each worker builds the tiktoken encoding once when it starts and reuses it for
+every sample it is handed. A failing sample is reported in the summary and
+doesn't stop the rest of the batch.
+"""
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from . import profiling
+from . import export
+from . import tokens
+
+DEFAULT_ROOT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                            "docs", "reference", "audio")
+
+
+def discover_samples(root=DEFAULT_ROOT):
+    """
+    Sample directories (sample-a, sample-b, ...) under root that have a formatted_srt.md.
+    """
+    samples = []
+    for name in sorted(os.listdir(root)):
+        sample_dir = os.path.join(root, name)
+        if os.path.isfile(os.path.join(sample_dir, "formatted_srt.md")):
+            samples.append(sample_dir)
+    return samples
+
+
+def sample_name(sample_dir):
+    name = os.path.basename(os.path.normpath(sample_dir))
+    return name[len("sample-"):] if name.startswith("sample-") else name
+
+
+def _init_worker(encoding_name, profile):
+    tokens.get_encoding(encoding_name)
+    if profile:
+        profiling.enable()
+
+
+def process_sample(sample_dir, output_dir, encoding_name=tokens.ENCODING_NAME):
+    """
+    tokenize -> merge -> export for one sample directory.
+
+    The stripped transcript that tokentest.py read from audio-<x>.txt is rebuilt
+    from the segment text of formatted_srt.md.
+
+    Returns:
+        Summary dict for the sample; failures are returned with an "error"
+        entry instead of raised, so one bad sample doesn't abort the batch
+    """
+    name = sample_name(sample_dir)
+    start = time.perf_counter()
+    summary = {"sample": name, "tokens": 0, "segments": 0, "seconds": 0.0}
+    first_span = len(profiling.records())
+    try:
+        with profiling.span("sample", sample=name):
+            with open(os.path.join(sample_dir, "formatted_srt.md"), "r", encoding="utf-8") as f:
+                speaker_segments = tokens.parse_srt_speakers(f.read())
+            if not speaker_segments:
+                raise Exception("no speaker segments found in formatted_srt.md")
+            text = "\n".join(segment["text"] for segment in speaker_segments)
+
+            token_list = tokens.tokenize_text(text, tokens.get_encoding(encoding_name))
+            completed_tokens = tokens.assign_speakers_to_tokens(token_list, speaker_segments)
+
+            output_path = os.path.join(output_dir, f"completed_tokens_{name}.json")
+            export.write_token_json(completed_tokens, output_path)
+
+        summary.update(tokens=len(completed_tokens), segments=len(speaker_segments), output=output_path)
+    except Exception as e:
+        summary["error"] = f"{type(e).__name__}: {e}"
+        summary["traceback"] = traceback.format_exc()
+    summary["seconds"] = time.perf_counter() - start
+    summary["spans"] = profiling.records()[first_span:]
+    return summary
+
+
+def run_corpus(sample_dirs, output_dir, workers=None, encoding_name=tokens.ENCODING_NAME, log=print):
+    """
+    Process sample directories across a process pool.
+
+    Returns:
+        Run summary with per-sample results, totals and tokens per second
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    results = []
+    start = time.perf_counter()
+
+    with profiling.span("corpus", items=len(sample_dirs)):
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(encoding_name, profiling.is_enabled())) as pool:
+            futures = {pool.submit(process_sample, sample_dir, output_dir, encoding_name): sample_dir
+                       for sample_dir in sample_dirs}
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e:  # the worker itself died
+                    result = {"sample": sample_name(futures[future]), "tokens": 0, "segments": 0,
+                              "seconds": 0.0, "error": f"{type(e).__name__}: {e}", "spans": []}
+                profiling.extend(result.pop("spans"))
+                results.append(result)
+                if "error" in result:
+                    log(f"✗ sample-{result['sample']}: {result['error']}")
+                else:
+                    log(f"✓ sample-{result['sample']}: {result['tokens']} tokens in {result['seconds']:.2f}s")
+
+    wall = time.perf_counter() - start
+    results.sort(key=lambda result: result["sample"])
+    total_tokens = sum(result["tokens"] for result in results)
+    return {
+        "samples": results,
+        "workers": workers,
+        "succeeded": sum("error" not in result for result in results),
+        "failed": sum("error" in result for result in results),
+        "tokens": total_tokens,
+        "seconds": wall,
+        "tokens_per_second": total_tokens / wall if wall > 0 else 0.0,
+    }
@@ -0,0 +1,99 @@
+"""
+pyannote, whisperx and numpy are imported inside the functions that use
+them; torch alone takes seconds to import.
+"""
+import os
+
+from . import profiling
+from .audio import SAMPLE_RATE
+
+DIARIZATION_MODEL = "pyannote/speaker-diarization-3.1"
+SEPARATION_MODEL = "pyannote/speech-separation-ami-1.0"
+
+
+def load_pipeline(hf_token, device="cpu"):
+    """The whisperx DiarizationPipeline, for callers that diarize more than once."""
+    import whisperx
+
+    with profiling.span("load_diarization"):
+        return whisperx.DiarizationPipeline(use_auth_token=hf_token, device=device)
+
+
+def diarize(audio, hf_token, device="cpu", min_speakers=None, max_speakers=None, return_embeddings=False,
+            pipeline=None):
+    """
+    Run pyannote speaker diarization through whisperx.
+    Returns a DataFrame of speaker turns (start, end, speaker), plus a
+    {speaker: embedding} dict when return_embeddings is set.
+    Pass a pipeline from load_pipeline() to skip loading it again.
+    """
+    with profiling.span("diarize") as span:
+        if pipeline is None:
+            pipeline = load_pipeline(hf_token, device)
+        if return_embeddings:
+            diarize_segments, embeddings = pipeline(audio, min_speakers=min_speakers, max_speakers=max_speakers,
+                                                    return_embeddings=True)
+        else:
+            diarize_segments = pipeline(audio, min_speakers=min_speakers, max_speakers=max_speakers)
+        span.add_items(len(diarize_segments))
+    if return_embeddings:
+        return diarize_segments, embeddings
+    return diarize_segments
+
+
+def assign_speakers(diarize_segments, result):
+    """
+    Label every aligned word/segment with the speaker whose turn overlaps it most.
+    """
+    import whisperx
+
+    with profiling.span("assign_speakers", items=len(result.get("word_segments", []))):
+        return whisperx.assign_word_speakers(diarize_segments, result)
+
+
+def speaker_turns(diarization):
+    """
+    Flatten a pyannote annotation into (start, end, speaker) tuples in time order.
+    """
+    return [(turn.start, turn.end, speaker) for turn, _, speaker in diarization.itertracks(yield_label=True)]
+
+
+def separate_speakers(audio_file, hf_token, output_dir="."):
+    """
+    Run pyannote.ami speech separation and write one WAV per speaker.
+    The pipeline runs on the whole file and returns all sources at once, so
+    memory grows with the recording; only the WAV writing is done in blocks.
+
+    Args:
+        audio_file: Path to the preprocessed 16kHz mono WAV
+        hf_token: Hugging Face token for the gated pyannote model
+        output_dir: Directory for the SPEAKER_XX.wav files and audio.rttm
+
+    Returns:
+        (diarization annotation, list of created WAV paths)
+    """
+    from pyannote.audio import Pipeline
+
+    from .mapped_audio import write_wav
+
+    with profiling.span("separate", file=os.path.basename(audio_file)):
+        pipeline = Pipeline.from_pretrained(SEPARATION_MODEL, use_auth_token=hf_token)
+        diarization, sources = pipeline(audio_file)
+
+    with open(os.path.join(output_dir, "audio.rttm"), "w") as rttm:
+        diarization.write_rttm(rttm)
+
+    created_audio_files = []
+
+    with profiling.span("write_sources", category="loop") as span:
+        for s, speaker in enumerate(diarization.labels()):
+            filename = os.path.join(output_dir, f'{speaker}.wav')
+
+            # sources.data[:, s] is a strided view; write_wav converts it to int16
+            # block by block instead of making a full-length copy per speaker
+            write_wav(filename, sources.data[:, s], SAMPLE_RATE)
+
+            created_audio_files.append(filename)                    # add file name to list
+            span.add_items()
+
+    return diarization, created_audio_files
@@ -0,0 +1,62 @@
+import json
+
+from . import profiling
+
+
+def format_srt_time(seconds):
+    """Seconds -> HH:MM:SS,mmm"""
+    return f"{int(seconds//3600):02d}:{int((seconds%3600)//60):02d}:{int(seconds%60):02d},{int((seconds%1)*1000):03d}"
+
+
+def format_word_cue(index, start_time, end_time, speaker, word_text):
+    return f"{index}\n{format_srt_time(start_time)} --> {format_srt_time(end_time)}\n[{speaker}] {word_text}\n\n"
+
+
+def create_token_array(whisperx_data):
+    """
+    Turn whisperx word_segments into [token #, start, end, speaker] rows.
+    Words whisperx couldn't align (no start/end) are skipped.
+    """
+    token_array = []
+
+    with profiling.span("token_array", category="loop") as span:
+        for token_counter, word in enumerate(whisperx_data["word_segments"], 1):
+            if "start" not in word or "end" not in word:
+                continue
+            token_array.append([
+                token_counter,                          # Unique token number
+                word["start"],                          # Start time
+                word["end"],                            # End time
+                word.get("speaker", "Unknown")          # Speaker ID (SPEAKER_00, SPEAKER_01, SPEAKER_02.)
+            ])
+        span.add_items(len(token_array))
+
+    return token_array
+
+
+def write_token_array(token_array, output_path):
+    with open(output_path, "w") as output_file:
+        json.dump(token_array, output_file, indent=2)
+
+
+def create_final_srt_file(token_array, whisperx_data, output_path):
+    """
+    Write one SRT cue per word, sorted by start time, labelled with the speaker.
+    """
+    word_segments = whisperx_data["word_segments"]
+    sorted_tokens = sorted(token_array, key=lambda x: x[1])  # Sorts by start time
+
+    with profiling.span("export_srt", items=len(sorted_tokens)):
+        with open(output_path, "w", encoding="utf-8") as srt_file:
+            for i, (token_num, start_time, end_time, speaker) in enumerate(sorted_tokens, 1):
+                word_text = word_segments[token_num - 1]["word"]
+                srt_file.write(format_word_cue(i, start_time, end_time, speaker, word_text))
+
+
+def write_token_json(tokens, output_path):
+    """
+    Write merged tokens in the same layout as docs/reference/audio/*/tokendata.json.
+    """
+    with profiling.span("export_tokens", items=len(tokens)):
+        with open(output_path, "w", encoding="utf-8") as f:
+            json.dump(tokens, f, indent=4)
@@ -0,0 +1,200 @@
+"""
+Incremental processing for recordings that keep growing.
+
+Each call decodes only the audio after the last stable segment boundary (plus
+a small overlap), transcribes, aligns and diarizes that tail, and appends the
+result to the existing outputs in output_dir:
+
+    whisperx_output.json       committed segments + the provisional tail
+    final_transcript.srt       committed word cues, appended to
+    provisional_transcript.srt word cues after the stable boundary, rewritten each run
+    incremental_state.json     what has been processed so far
+    speakers/                  file-local SpeakerRegistry keeping labels stable across tails
+
+Segments that end close to the current end of the file may still change once
+more audio arrives, so they are kept provisional and transcribed again next
+time. Everything before the stable boundary is never touched again.
+
+    python -m diarscription tail recording.wav --output-dir out --watch 60
+"""
+import json
+import os
+
+from . import profiling
+from . import audio as audio_stage
+from . import diarization
+from . import export
+from . import transcription
+from .audio import SAMPLE_RATE
+
+STATE_FILE = "incremental_state.json"
+
+# Audio re-decoded before the stable boundary, so the models get context
+OVERLAP_SECONDS = 5.0
+
+# Segments ending within this much of the tail end stay provisional
+GUARD_SECONDS = 3.0
+
+# Don't bother running the models for less new audio than this
+MIN_NEW_SECONDS = 5.0
+
+
+def load_state(output_dir):
+    try:
+        with open(os.path.join(output_dir, STATE_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {
+            "source": None,
+            "source_size": 0,
+            "source_mtime": 0.0,
+            "decoded_samples": 0,    # sample offset up to which the file has been decoded
+            "stable_until": 0.0,     # seconds; everything before this is committed
+            "srt_cues": 0,           # cues already appended to final_transcript.srt
+        }
+
+
+def save_state(output_dir, state):
+    temp = os.path.join(output_dir, STATE_FILE + ".tmp")
+    with open(temp, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(temp, os.path.join(output_dir, STATE_FILE))
+
+
+def _load_committed(output_dir):
+    try:
+        with open(os.path.join(output_dir, "whisperx_output.json"), "r", encoding="utf-8") as f:
+            result = json.load(f)
+    except (OSError, ValueError):
+        return [], None
+    return [segment for segment in result["segments"] if not segment.get("provisional")], result.get("language")
+
+
+def _relabel(diarize_segments, embeddings, output_dir, source):
+    """
+    Map this tail's diarization labels onto the labels used for earlier tails
+    of the same file, using a file-local speaker registry.
+    """
+    from .speakers import SpeakerRegistry
+
+    registry = SpeakerRegistry(os.path.join(output_dir, "speakers"))
+    identities = registry.label_meeting(embeddings, meeting=os.path.basename(source))
+    registry.save()
+    mapping = {label: f"SPEAKER_{identity['identity']:02d}" for label, identity in identities.items()}
+    diarize_segments["speaker"] = diarize_segments["speaker"].map(lambda label: mapping.get(label, label))
+    return diarize_segments
+
+
+def _word_segments(segments):
+    return [word for segment in segments for word in segment.get("words", [])]
+
+
+def process_tail(audio_file, output_dir, hf_token=None, model_name=transcription.MODEL_NAME,
+                 device=transcription.DEVICE, models=None, overlap=OVERLAP_SECONDS, guard=GUARD_SECONDS,
+                 min_new_seconds=MIN_NEW_SECONDS, **overrides):
+    """
+    Bring the outputs in output_dir up to date with a growing recording.
+
+    Args:
+        audio_file: Recording that may have grown since the last call
+        output_dir: Where outputs and incremental_state.json live
+        hf_token: Hugging Face token; without one, speakers aren't assigned
+        models: Dict the whisper, align and diarization models are loaded into
+            and reused from across calls, so `tail --watch` loads each of them once
+        overlap: Seconds re-decoded before the stable boundary
+        guard: Segments ending this close to the end of the audio stay provisional
+        min_new_seconds: Skip the run if less new audio than this is available
+        **overrides: Transcription settings, see transcription.resolve_settings()
+
+    Returns:
+        Seconds of new audio processed (0.0 if nothing was done)
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    state = load_state(output_dir)
+    source = os.path.abspath(audio_file)
+    if state["source"] not in (None, source):
+        raise Exception(f"{output_dir} holds incremental outputs for {state['source']}, not {source}")
+
+    stat = os.stat(source)
+    if stat.st_size == state["source_size"] and stat.st_mtime == state["source_mtime"]:
+        return 0.0
+
+    stable_until = state["stable_until"]
+    tail_start = max(0.0, stable_until - overlap)
+
+    with profiling.span("tail", file=os.path.basename(source), start=tail_start):
+        tail = audio_stage.decode_pcm(source, start=tail_start)
+        tail_end = tail_start + len(tail) / SAMPLE_RATE
+        new_seconds = tail_end - state["decoded_samples"] / SAMPLE_RATE
+        if new_seconds < min_new_seconds:
+            return 0.0
+
+        settings = transcription.resolve_settings(model_name, **overrides)
+        models = {} if models is None else models
+        if "whisper" not in models:
+            models["whisper"] = transcription.load_model(model_name, device, settings["compute_type"],
+                                                         vad_onset=settings["vad_onset"],
+                                                         vad_offset=settings["vad_offset"], threads=settings["threads"])
+        result = transcription.transcribe(models["whisper"], tail, batch_size=settings["batch_size"],
+                                          chunk_size=settings["chunk_size"])
+        align_key = ("align", result["language"])
+        if align_key not in models:
+            models[align_key] = transcription.load_align_model(result["language"], device)
+        result = transcription.align(result, tail, device=device, align_model=models[align_key])
+
+        if hf_token:
+            if "diarize" not in models:
+                models["diarize"] = diarization.load_pipeline(hf_token, device)
+            diarize_segments, embeddings = diarization.diarize(tail, hf_token, device=device,
+                                                               return_embeddings=True, pipeline=models["diarize"])
+            diarize_segments = _relabel(diarize_segments, embeddings, output_dir, source)
+            result = diarization.assign_speakers(diarize_segments, result)
+
+        with profiling.span("reconcile"):
+            committed, language = _load_committed(output_dir)
+            new_segments = transcription.shift_segments(result["segments"], tail_start)
+
+            # Segments that sit mostly inside the overlap were committed by an earlier
+            # run; the midpoint test tolerates small boundary shifts between runs
+            new_segments = [segment for segment in new_segments
+                            if (segment["start"] + segment["end"]) / 2 >= stable_until]
+            cutoff = len(new_segments)
+            for i, segment in enumerate(new_segments):
+                if segment["end"] > tail_end - guard:
+                    cutoff = i
+                    break
+            stable, provisional = new_segments[:cutoff], new_segments[cutoff:]
+            for segment in provisional:
+                segment["provisional"] = True
+            if stable:
+                stable_until = stable[-1]["end"]
+            if not provisional:
+                # nothing pending (e.g. a long silence): move the boundary up so the
+                # next run doesn't decode the silence again
+                stable_until = max(stable_until, tail_end - guard)
+
+        with profiling.span("export"):
+            segments = committed + stable + provisional
+            merged = {"segments": segments, "word_segments": _word_segments(segments),
+                      "language": language or result.get("language")}
+            with open(os.path.join(output_dir, "whisperx_output.json"), "w", encoding="utf-8") as f:
+                json.dump(merged, f, default=float)
+
+            cue = state["srt_cues"]
+            with open(os.path.join(output_dir, "final_transcript.srt"), "a", encoding="utf-8") as srt_file:
+                for word in _word_segments(stable):
+                    if "start" in word and "end" in word:
+                        cue += 1
+                        srt_file.write(export.format_word_cue(cue, word["start"], word["end"],
+                                                              word.get("speaker", "Unknown"), word["word"]))
+            with open(os.path.join(output_dir, "provisional_transcript.srt"), "w", encoding="utf-8") as srt_file:
+                timed = [word for word in _word_segments(provisional) if "start" in word and "end" in word]
+                for i, word in enumerate(timed, cue + 1):
+                    srt_file.write(export.format_word_cue(i, word["start"], word["end"],
+                                                          word.get("speaker", "Unknown"), word["word"]))
+
+        state.update(source=source, source_size=stat.st_size, source_mtime=stat.st_mtime,
+                     decoded_samples=int(round(tail_end * SAMPLE_RATE)), stable_until=stable_until, srt_cues=cue)
+        save_state(output_dir, state)
+
+    return new_seconds
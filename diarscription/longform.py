@@ -0,0 +1,261 @@
+"""
+Windowed diarization for recordings too long for one pyannote call.
+
+speaker-diarization-3.1 run over a whole file holds the full waveform and
+its segmentation and embedding outputs at once, so memory and runtime grow
+with the length of the recording. diarize_long() instead:
+
+1. cuts the memory-mapped WAV into overlapping windows (WINDOW seconds,
+   OVERLAP seconds shared with the next window)
+2. diarizes the windows on a process pool. Each worker loads the pipeline
+   once and reads only its own window from the mapped file, through
+   MappedAudio.pyannote_input()
+3. stitches the window-local labels into global speakers by agglomerative
+   clustering of the per-window speaker embeddings (average linkage on
+   cosine similarity). Two labels from the same window are never merged
+4. cuts every window back to the half of each overlap nearest its own
+   centre, so each stretch of audio is covered by one window only, and
+   joins same-speaker turns that meet at a seam
+
+    python -m diarscription diarize all-day.wav --window 600 --overlap 30 --workers 4
+
+Peak memory is one window per worker plus the models, whatever the length
+of the recording.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from . import profiling
+from .diarization import DIARIZATION_MODEL
+
+WINDOW = 600.0
+OVERLAP = 30.0
+
+# Cosine similarity above which two window-local speakers are the same person;
+# within one recording voices match more closely than across meetings
+# (speakers.THRESHOLD)
+STITCH_THRESHOLD = 0.5
+
+# Same-speaker turns this close together at a seam are joined
+MERGE_GAP = 0.5
+
+_pipeline = None
+
+
+def plan_windows(duration, window=WINDOW, overlap=OVERLAP):
+    """
+    (start, end, keep_start, keep_end) per window: the window is diarized over
+    [start, end) and its turns are kept only inside [keep_start, keep_end).
+    """
+    if duration <= window:
+        return [(0.0, float(duration), 0.0, float(duration))]
+    hop = window - overlap
+    starts = np.arange(0.0, duration - overlap, hop)
+    windows = []
+    for i, start in enumerate(starts):
+        end = min(start + window, duration)
+        keep_start = 0.0 if i == 0 else start + overlap / 2
+        keep_end = duration if i == len(starts) - 1 else end - overlap / 2
+        windows.append((float(start), float(end), float(keep_start), float(keep_end)))
+    return windows
+
+
+def _init_worker(hf_token, device, threads, profile):
+    global _pipeline
+
+    import torch
+    from pyannote.audio import Pipeline
+
+    if threads:
+        torch.set_num_threads(threads)
+    if profile:
+        profiling.enable()
+    _pipeline = Pipeline.from_pretrained(DIARIZATION_MODEL, use_auth_token=hf_token)
+    _pipeline.to(torch.device(device))
+
+
+def diarize_window(audio_file, start, end, max_speakers=None):
+    """
+    Diarize [start, end) of a 16kHz WAV in a worker.
+
+    Returns:
+        {"turns": [(start, end, local label)] on the global timeline,
+         "labels": [...], "embeddings": labels x dim array, "spans": [...]}
+    """
+    from .mapped_audio import MappedAudio
+
+    first_span = len(profiling.records())
+    audio = MappedAudio(audio_file)
+    try:
+        with profiling.span("diarize_window", category="loop", start=start):
+            diarization, embeddings = _pipeline(audio.pyannote_input(start, end), max_speakers=max_speakers,
+                                                return_embeddings=True)
+    finally:
+        audio.close()
+
+    labels = diarization.labels()
+    turns = [(start + turn.start, start + turn.end, label)
+             for turn, _, label in diarization.itertracks(yield_label=True)]
+    return {"turns": turns, "labels": labels, "embeddings": np.asarray(embeddings, dtype=np.float32)[:len(labels)],
+            "spans": profiling.records()[first_span:]}
+
+
+def cluster_speakers(embeddings, groups, threshold=STITCH_THRESHOLD, max_speakers=None, min_speakers=None):
+    """
+    Average-linkage agglomerative clustering on cosine similarity with
+    cannot-link constraints: rows that share a group (a window) never end up
+    in the same cluster.
+
+    Args:
+        embeddings: n x dim array
+        groups: Group id per row
+        max_speakers: Keep merging below the threshold until at most this many
+            clusters are left (constraints still apply)
+        min_speakers: Stop merging, even above the threshold, once this many
+            clusters are left
+
+    Returns:
+        Cluster index per row, numbered by first appearance
+    """
+    n = len(embeddings)
+    if n == 0:
+        return np.zeros(0, dtype=int)
+    unit = embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+    similarity = (unit @ unit.T).astype(np.float64)
+    groups = np.asarray(groups)
+    blocked = groups[:, None] == groups[None, :]
+    sizes = np.ones(n)
+    active = np.ones(n, dtype=bool)
+    members = np.arange(n)
+
+    while active.sum() > max(1, min_speakers or 1):
+        candidates = np.where(blocked | ~active[None, :] | ~active[:, None], -np.inf, similarity)
+        a, b = np.unravel_index(np.argmax(candidates), candidates.shape)
+        best = candidates[a, b]
+        if best == -np.inf or (best < threshold and (max_speakers is None or active.sum() <= max_speakers)):
+            break
+        # merge b into a; the average linkage of the union is the size-weighted mean
+        similarity[a] = (sizes[a] * similarity[a] + sizes[b] * similarity[b]) / (sizes[a] + sizes[b])
+        similarity[:, a] = similarity[a]
+        blocked[a] |= blocked[b]
+        blocked[:, a] = blocked[a]
+        sizes[a] += sizes[b]
+        active[b] = False
+        members[members == b] = a
+
+    # renumber clusters 0, 1, ... in order of first appearance
+    _, first, inverse = np.unique(members, return_index=True, return_inverse=True)
+    rank = np.empty(len(first), dtype=int)
+    rank[np.argsort(first)] = np.arange(len(first))
+    return rank[inverse]
+
+
+def stitch(results, windows, threshold=STITCH_THRESHOLD, max_speakers=None, merge_gap=MERGE_GAP, min_speakers=None):
+    """
+    Turn per-window results into global turns and per-speaker embeddings.
+
+    Returns:
+        (turns as {start, end, speaker} dicts in time order, {speaker: mean unit embedding})
+    """
+    rows = []
+    for w, result in enumerate(results):
+        for label, embedding in zip(result["labels"], result["embeddings"]):
+            if np.all(np.isfinite(embedding)):
+                rows.append((w, label, embedding))
+    if not rows:
+        return [], {}
+
+    clusters = cluster_speakers(np.stack([embedding for _, _, embedding in rows]), [w for w, _, _ in rows],
+                                threshold, max_speakers, min_speakers)
+    names = {(w, label): f"SPEAKER_{cluster:02d}" for (w, label, _), cluster in zip(rows, clusters)}
+
+    turns = []
+    for w, (result, (_, _, keep_start, keep_end)) in enumerate(zip(results, windows)):
+        for start, end, label in result["turns"]:
+            start, end = max(start, keep_start), min(end, keep_end)
+            if end > start and (w, label) in names:  # labels without an embedding had too little speech
+                turns.append({"start": start, "end": end, "speaker": names[(w, label)]})
+    turns.sort(key=lambda turn: (turn["start"], turn["speaker"]))
+
+    # a turn cut at a seam continues in the next window; pyannote's own turn boundaries stay as they are
+    seams = np.array([keep_end for _, _, _, keep_end in windows[:-1]])
+    merged = []
+    last_by_speaker = {}
+    for turn in turns:
+        previous = last_by_speaker.get(turn["speaker"])
+        if (previous is not None and turn["start"] - previous["end"] <= merge_gap
+                and np.any(np.abs(seams - previous["end"]) <= merge_gap)):
+            previous["end"] = max(previous["end"], turn["end"])
+            continue
+        merged.append(turn)
+        last_by_speaker[turn["speaker"]] = turn
+
+    embeddings = {}
+    for (w, label, embedding), cluster in zip(rows, clusters):
+        embeddings.setdefault(f"SPEAKER_{cluster:02d}", []).append(embedding / max(np.linalg.norm(embedding), 1e-12))
+    return merged, {speaker: np.mean(vectors, axis=0) for speaker, vectors in embeddings.items()}
+
+
+def diarize_long(audio_file, hf_token, window=WINDOW, overlap=OVERLAP, workers=None, device="cpu",
+                 max_speakers=None, threshold=STITCH_THRESHOLD, min_speakers=None, log=print):
+    """
+    Diarize a long 16kHz WAV window by window.
+
+    Args:
+        audio_file: 16kHz WAV (memory-mapped, never fully loaded); anything
+            else is decoded to a temporary WAV first
+        window, overlap: Window length and overlap between neighbours, seconds
+        workers: Worker processes (default: cores // 4, each with its share of torch threads)
+        max_speakers: Upper bound per window and for the whole recording
+        min_speakers: Lower bound for the whole recording, applied when the
+            window speakers are stitched (a single window may hold fewer)
+
+    Returns:
+        (turns as {start, end, speaker} dicts, {speaker: embedding}); the
+        embeddings can go straight into SpeakerRegistry.label_meeting()
+    """
+    from .audio import open_mapped, preprocess_audio
+
+    if overlap >= window:
+        raise Exception(f"Overlap ({overlap}s) must be shorter than the window ({window}s)")
+
+    audio = open_mapped(audio_file)
+    if audio is None:
+        temp_path = preprocess_audio(audio_file)
+        try:
+            return diarize_long(temp_path, hf_token, window, overlap, workers, device, max_speakers, threshold,
+                                min_speakers, log)
+        finally:
+            os.remove(temp_path)
+    duration = audio.duration
+    audio.close()
+
+    windows = plan_windows(duration, window, overlap)
+    cores = os.cpu_count() or 1
+    workers = min(workers or max(1, cores // 4), len(windows))
+    threads = max(1, cores // workers)
+
+    results = [None] * len(windows)
+    with profiling.span("diarize_long", items=len(windows)):
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(hf_token, device, threads, profiling.is_enabled())) as pool:
+            futures = {pool.submit(diarize_window, audio_file, start, end, max_speakers): i
+                       for i, (start, end, _, _) in enumerate(windows)}
+            for done, future in enumerate(futures, 1):
+                i = futures[future]
+                results[i] = future.result()
+                profiling.extend(results[i].pop("spans"))
+                log(f"✓ window {done}/{len(windows)}: {len(results[i]['labels'])} speakers")
+
+        with profiling.span("stitch"):
+            turns, embeddings = stitch(results, windows, threshold, max_speakers, min_speakers=min_speakers)
+    return turns, embeddings
+
+
+def to_dataframe(turns):
+    """Turns in the DataFrame layout diarization.diarize() returns (for assign_speakers)."""
+    import pandas as pd
+
+    return pd.DataFrame(turns, columns=["start", "end", "speaker"])
@@ -0,0 +1,225 @@
+"""
+Memory-mapped, windowed access to PCM/WAV audio.
+
+whisperx.load_audio and pyannote read whole recordings into RAM. MappedAudio
+maps the file instead and hands out NumPy views of any time window, so a
+stage that only needs a few seconds at a time only ever touches those pages:
+
+    audio = MappedAudio("meeting.wav")
+    view = audio.view(60.0, 90.0)           # int16 view, no copy
+    clip = audio.samples(60.0, 90.0)        # float32 copy of just that window
+    for start, block in audio.windows(30.0, hop=25.0):
+        ...
+
+Views keep the file's own sample type (usually int16); samples() and
+windows() convert one window at a time to float32 in [-1, 1]. Peak memory is
+therefore set by the window size, not by the length of the file.
+
+write_wav() and MappedAudio.create() go the other way and write large
+outputs (separated sources, clips) block by block.
+"""
+import os
+import struct
+
+import numpy as np
+
+from .audio import SAMPLE_RATE
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+BLOCK_FRAMES = 1 << 16
+
+_PCM_DTYPES = {8: np.uint8, 16: np.int16, 32: np.int32}
+
+
+def _parse_wav_header(path):
+    """
+    Return (data offset, data size, sample rate, channels, dtype) for a WAV file.
+    A data size of 0 or 0xFFFFFFFF (left by recorders that are still writing)
+    means "to the end of the file".
+    """
+    with open(path, "rb") as f:
+        riff, _, wave = struct.unpack("<4sI4s", f.read(12))
+        if riff != b"RIFF" or wave != b"WAVE":
+            raise Exception(f"{path} is not a RIFF/WAVE file")
+
+        fmt = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise Exception(f"{path} has no data chunk")
+            chunk_id, chunk_size = struct.unpack("<4sI", header)
+            if chunk_id == b"fmt ":
+                body = f.read(chunk_size)
+                format_tag, channels, sample_rate, _, _, bits = struct.unpack("<HHIIHH", body[:16])
+                if format_tag == WAVE_FORMAT_EXTENSIBLE and len(body) >= 26:
+                    format_tag = struct.unpack("<H", body[24:26])[0]
+                fmt = (format_tag, channels, sample_rate, bits)
+                if chunk_size % 2:
+                    f.seek(1, 1)
+            elif chunk_id == b"data":
+                if fmt is None:
+                    raise Exception(f"{path} has a data chunk before its fmt chunk")
+                offset = f.tell()
+                break
+            else:
+                f.seek(chunk_size + chunk_size % 2, 1)
+
+        f.seek(0, 2)
+        file_size = f.tell()
+
+    format_tag, channels, sample_rate, bits = fmt
+    if format_tag == WAVE_FORMAT_IEEE_FLOAT and bits == 32:
+        dtype = np.float32
+    elif format_tag == WAVE_FORMAT_PCM and bits in _PCM_DTYPES:
+        dtype = _PCM_DTYPES[bits]
+    else:
+        raise Exception(f"{path}: unsupported WAV encoding (format {format_tag}, {bits} bits)")
+
+    if chunk_size in (0, 0xFFFFFFFF) or offset + chunk_size > file_size:
+        chunk_size = file_size - offset
+    return offset, chunk_size, sample_rate, channels, np.dtype(dtype)
+
+
+def _wav_header(frames, channels, sample_rate, dtype):
+    dtype = np.dtype(dtype)
+    format_tag = WAVE_FORMAT_IEEE_FLOAT if dtype.kind == "f" else WAVE_FORMAT_PCM
+    block_align = channels * dtype.itemsize
+    data_size = frames * block_align
+    return struct.pack("<4sI4s4sIHHIIHH4sI", b"RIFF", 36 + data_size, b"WAVE", b"fmt ", 16, format_tag,
+                       channels, sample_rate, sample_rate * block_align, block_align, dtype.itemsize * 8,
+                       b"data", data_size)
+
+
+def to_float32(samples):
+    """Convert a PCM block to float32 in [-1, 1]."""
+    if samples.dtype == np.float32:
+        return np.array(samples, dtype=np.float32)
+    if samples.dtype == np.uint8:
+        return (samples.astype(np.float32) - 128.0) / 128.0
+    return samples.astype(np.float32) / float(np.iinfo(samples.dtype).max + 1)
+
+
+def to_int16(samples):
+    """Convert a float block in [-1, 1] to int16 (clipped), as the pyannoteami step did."""
+    return (np.clip(samples, -1.0, 1.0) * 32767).astype(np.int16)
+
+
+class MappedAudio:
+    """
+    A WAV or headerless PCM file mapped into memory.
+
+    Args:
+        path: .wav file, or raw PCM if sample_rate/channels/dtype are given
+        sample_rate, channels, dtype: Layout of a raw PCM file (ignored for WAV)
+        offset: Byte offset of the samples in a raw PCM file
+        mode: "r" for read-only, "r+" to write into the mapped samples
+    """
+    def __init__(self, path, sample_rate=None, channels=None, dtype=None, offset=0, mode="r"):
+        self.path = path
+        if dtype is None:
+            offset, size, sample_rate, channels, dtype = _parse_wav_header(path)
+        else:
+            size = os.path.getsize(path) - offset
+            dtype = np.dtype(dtype)
+            sample_rate = sample_rate or SAMPLE_RATE
+            channels = channels or 1
+
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.dtype = dtype
+        self.frames = size // (channels * dtype.itemsize)
+        if self.frames:
+            self._data = np.memmap(path, dtype=dtype, mode=mode, offset=offset, shape=(self.frames, channels))
+        else:
+            self._data = np.zeros((0, channels), dtype=dtype)
+
+    @classmethod
+    def create(cls, path, frames, channels=1, sample_rate=SAMPLE_RATE, dtype=np.int16):
+        """
+        Create a WAV file of the given size and map it for writing, so outputs
+        can be filled in window by window.
+        """
+        header = _wav_header(frames, channels, sample_rate, dtype)
+        with open(path, "wb") as f:
+            f.write(header)
+            f.truncate(len(header) + frames * channels * np.dtype(dtype).itemsize)
+        return cls(path, mode="r+")
+
+    @property
+    def duration(self):
+        return self.frames / self.sample_rate
+
+    def frame(self, seconds):
+        """Frame index for a time in seconds, clamped to the file."""
+        return min(max(int(round(seconds * self.sample_rate)), 0), self.frames)
+
+    def view(self, start=0.0, end=None, channels=None):
+        """
+        Zero-copy view of [start, end) seconds.
+
+        Args:
+            channels: None for all channels (frames x channels), an int for one
+                channel (1-D) or a slice; all of these stay views. A list of
+                channels works too but NumPy has to copy for that
+        """
+        first = self.frame(start)
+        last = self.frames if end is None else self.frame(end)
+        block = self._data[first:max(first, last)]
+        if channels is None:
+            return block
+        return block[:, channels]
+
+    def samples(self, start=0.0, end=None, channel=None):
+        """
+        float32 copy of one window. With channel=None a multi-channel file is
+        downmixed to mono, which is what whisperx and pyannote expect.
+        """
+        if channel is None and self.channels > 1:
+            return to_float32(self.view(start, end)).mean(axis=1)
+        return to_float32(self.view(start, end, 0 if channel is None else channel))
+
+    def windows(self, window, hop=None, channel=None, start=0.0, end=None):
+        """
+        Yield (window start seconds, float32 samples) over [start, end).
+        hop defaults to window (no overlap).
+        """
+        hop = hop or window
+        end = self.duration if end is None else min(end, self.duration)
+        position = start
+        while position < end:
+            yield position, self.samples(position, min(position + window, end), channel)
+            position += hop
+
+    def pyannote_input(self, start=0.0, end=None, channel=None):
+        """
+        One window in the {"waveform", "sample_rate"} form pyannote pipelines accept
+        instead of a file path.
+        """
+        import torch
+
+        return {"waveform": torch.from_numpy(self.samples(start, end, channel)).unsqueeze(0),
+                "sample_rate": self.sample_rate}
+
+    def flush(self):
+        if isinstance(self._data, np.memmap):
+            self._data.flush()
+
+    def close(self):
+        self.flush()
+        self._data = None
+
+
+def write_wav(path, samples, sample_rate=SAMPLE_RATE, block_frames=BLOCK_FRAMES):
+    """
+    Write float samples (frames, or frames x channels) as an int16 WAV, converting
+    block_frames at a time instead of making a full int16 copy first.
+    """
+    samples = samples if samples.ndim == 2 else samples[:, None]
+    frames, channels = samples.shape
+    with open(path, "wb") as f:
+        f.write(_wav_header(frames, channels, sample_rate, np.int16))
+        for first in range(0, frames, block_frames):
+            f.write(to_int16(samples[first:first + block_frames]).tobytes())
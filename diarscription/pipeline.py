@@ -0,0 +1,114 @@
+"""
+End-to-end run: decode -> VAD/transcribe -> align -> diarize -> assign speakers -> export.
+
+    python -m diarscription run meeting.mp3 --hf-token hf_xxx --output-dir out
+"""
+import gc
+import json
+import os
+
+from . import profiling
+from . import audio as audio_stage
+from . import diarization
+from . import export
+from . import transcription
+
+
+def run(audio_file, output_dir, hf_token, model_name=transcription.MODEL_NAME,
+        device=transcription.DEVICE, min_speakers=None, max_speakers=None, registry=None, repair=False,
+        fast_model=None, denoise=False, **overrides):
+    """
+    Run the whole pipeline on one recording and write whisperx_output.json,
+    token_array.json and final_transcript.srt into output_dir.
+
+    Transcription settings (compute_type, batch_size, threads, chunk_size,
+    vad_onset, vad_offset) come from transcription.resolve_settings(); pass
+    any of them as keyword arguments to override the autotuned/default value.
+
+    With a speaker registry directory, the diarization labels are mapped to
+    cross-meeting identities, stored under result["speaker_identities"].
+
+    With a fast_model (e.g. "base"), the recording is transcribed with it first
+    and only low-confidence spans go through model_name (see cascade.py).
+
+    With denoise=True, stationary background noise is gated out of the decoded
+    audio before VAD and transcription (see denoise.py).
+
+    With repair=True, windows where whisper looped or hallucinated are
+    re-decoded with sampling temperatures before diarization (see repetition.py).
+
+    Returns:
+        The speaker-labelled whisperx result
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    with profiling.span("pipeline", file=os.path.basename(audio_file)):
+        wav_path = audio_stage.preprocess_audio(audio_file, denoise=denoise)
+        try:
+            audio = audio_stage.load_audio(wav_path)
+        finally:
+            os.remove(wav_path)
+
+        settings = transcription.resolve_settings(model_name, **overrides)
+        models = {}
+
+        def load_main_model():
+            # loaded at most once: the cascade's escalation and the repair retry share it
+            if model_name not in models:
+                models[model_name] = transcription.load_model(model_name, device, settings["compute_type"],
+                                                              vad_onset=settings["vad_onset"],
+                                                              vad_offset=settings["vad_offset"],
+                                                              threads=settings["threads"])
+            return models[model_name]
+
+        if fast_model:
+            from . import cascade
+
+            fast_settings = transcription.resolve_settings(fast_model, **overrides)
+            model = transcription.load_model(fast_model, device, fast_settings["compute_type"],
+                                             vad_onset=fast_settings["vad_onset"],
+                                             vad_offset=fast_settings["vad_offset"], threads=fast_settings["threads"])
+            result, _ = cascade.transcribe_cascade(audio, model, load_main_model, device=device,
+                                                   fast_settings=fast_settings, slow_settings=settings)
+            del model
+            gc.collect()  # the fast model is done; free it before anything else is loaded
+        else:
+            result = transcription.transcribe(load_main_model(), audio, batch_size=settings["batch_size"],
+                                              chunk_size=settings["chunk_size"])
+            result = transcription.align(result, audio, device=device)
+
+        if repair:
+            from . import repetition
+
+            if repetition.flag_windows(result["segments"]):
+                # same model with sampling temperatures, not a second copy of it
+                transcription.set_asr_options(load_main_model(), repetition.RETRY_ASR_OPTIONS)
+                result, _ = repetition.repair(result, audio, load_main_model(), device=device,
+                                              batch_size=settings["batch_size"], chunk_size=settings["chunk_size"])
+        models.clear()
+        gc.collect()  # whisper is done; free it before the diarization pipeline loads
+
+        diarize_segments = diarization.diarize(audio, hf_token, device=device,
+                                               min_speakers=min_speakers, max_speakers=max_speakers,
+                                               return_embeddings=registry is not None)
+        if registry is not None:
+            from .speakers import SpeakerRegistry
+
+            diarize_segments, embeddings = diarize_segments
+            with profiling.span("identify_speakers", items=len(embeddings)):
+                speaker_registry = SpeakerRegistry(registry)
+                identities = speaker_registry.label_meeting(embeddings, meeting=os.path.basename(audio_file))
+                speaker_registry.save()
+        result = diarization.assign_speakers(diarize_segments, result)
+        if registry is not None:
+            result["speaker_identities"] = identities
+
+        with profiling.span("export"):
+            with open(os.path.join(output_dir, "whisperx_output.json"), "w", encoding="utf-8") as f:
+                json.dump(result, f, default=float)
+            token_array = export.create_token_array(result)
+            export.write_token_array(token_array, os.path.join(output_dir, "token_array.json"))
+            export.create_final_srt_file(token_array, result, os.path.join(output_dir, "final_transcript.srt"))
+
+    return result
+
@@ -0,0 +1,261 @@
+"""
+Named profiling spans for the diarscription pipeline.
+
+Wrap a stage or a hot loop in a span:
+
+    from diarscription import profiling
+
+    with profiling.span("merge", items=len(tokens)):
+        ...
+
+Each span records wall time, CPU time, the growth of the peak RSS and the
+number of items processed. Spans are only recorded once profiling has been
+turned on with profiling.enable() or DIARSCRIPTION_PROFILE=1. While it is off,
+span() hands back one shared no-op object, so leaving spans in hot paths
+costs a single flag check per call.
+
+Results can be written as a Chrome trace-event file (open it in
+chrome://tracing or https://ui.perfetto.dev) and as a JSON/plain-text summary.
+"""
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Windows has no resource module
+    resource = None
+
+_enabled = os.environ.get("DIARSCRIPTION_PROFILE", "") not in ("", "0")
+_records = []
+_lock = threading.Lock()
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def is_enabled():
+    return _enabled
+
+
+def reset():
+    """Drop every span recorded so far."""
+    with _lock:
+        del _records[:]
+
+
+def records():
+    """Return a copy of the spans recorded so far (one dict per span)."""
+    with _lock:
+        return list(_records)
+
+
+def extend(span_records):
+    """Add spans recorded somewhere else, e.g. in a worker process."""
+    with _lock:
+        _records.extend(span_records)
+
+
+def peak_rss_bytes():
+    """
+    Peak resident set size of this process in bytes, or 0 if it can't be read.
+    """
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports kilobytes, macOS reports bytes
+        return peak if sys.platform == "darwin" else peak * 1024
+    try:
+        import psutil
+    except ImportError:
+        return 0
+    info = psutil.Process().memory_info()
+    return getattr(info, "peak_wset", info.rss)
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def add_items(self, count=1):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    """
+    A single timed region. Use it through span() rather than directly.
+    """
+    __slots__ = ("name", "category", "items", "args", "_wall", "_cpu", "_rss")
+
+    def __init__(self, name, category, items, args):
+        self.name = name
+        self.category = category
+        self.items = items
+        self.args = args
+
+    def add_items(self, count=1):
+        """Count items processed inside the span, e.g. from within a loop."""
+        self.items += count
+
+    def __enter__(self):
+        self._rss = peak_rss_bytes()
+        self._cpu = time.process_time()
+        self._wall = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall_end = time.perf_counter()
+        cpu_end = time.process_time()
+        record = {
+            "name": self.name,
+            "category": self.category,
+            "start": self._wall,
+            "wall": wall_end - self._wall,
+            "cpu": cpu_end - self._cpu,
+            "rss_delta": peak_rss_bytes() - self._rss,
+            "items": self.items,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": self.args,
+        }
+        if exc_type is not None:
+            record["error"] = exc_type.__name__
+        with _lock:
+            _records.append(record)
+        return False
+
+
+def span(name, category="stage", items=0, **args):
+    """
+    Time a region of code under a name.
+
+    Args:
+        name: Span name shown in the trace and the summary (e.g. "transcribe")
+        category: Grouping used by the trace viewer ("stage" or "loop")
+        items: Number of items processed, if known up front. Can also be
+            counted as you go with span.add_items()
+        **args: Extra values stored with the span (file names, model names)
+    """
+    if not _enabled:
+        return _NULL_SPAN
+    return Span(name, category, items, args)
+
+
+def profiled(name=None, category="stage"):
+    """Decorator version of span(); the span name defaults to the function name."""
+    def decorator(func):
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with Span(span_name, category, 0, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def summary(span_records=None):
+    """
+    Aggregate spans by name, in order of first appearance.
+    Returns a list of rows with calls, wall/cpu totals, peak RSS growth and items.
+    """
+    if span_records is None:
+        span_records = records()
+    rows = {}
+    for record in span_records:
+        row = rows.get(record["name"])
+        if row is None:
+            row = rows[record["name"]] = {
+                "name": record["name"],
+                "calls": 0,
+                "wall": 0.0,
+                "cpu": 0.0,
+                "rss_delta": 0,
+                "items": 0,
+            }
+        row["calls"] += 1
+        row["wall"] += record["wall"]
+        row["cpu"] += record["cpu"]
+        row["rss_delta"] = max(row["rss_delta"], record["rss_delta"])
+        row["items"] += record["items"]
+    for row in rows.values():
+        row["items_per_sec"] = row["items"] / row["wall"] if row["wall"] > 0 else 0.0
+    return list(rows.values())
+
+
+def format_summary(span_records=None):
+    """Render summary() as a fixed-width text table."""
+    rows = summary(span_records)
+    lines = [f"{'span':<24} {'calls':>6} {'wall s':>10} {'cpu s':>10} {'peak rss +MB':>13} {'items':>10} {'items/s':>12}"]
+    lines.append("-" * len(lines[0]))
+    for row in rows:
+        lines.append(
+            f"{row['name'][:24]:<24} {row['calls']:>6} {row['wall']:>10.3f} {row['cpu']:>10.3f} "
+            f"{row['rss_delta'] / 1048576:>13.1f} {row['items']:>10} {row['items_per_sec']:>12.1f}"
+        )
+    return "\n".join(lines)
+
+
+def write_chrome_trace(path, span_records=None):
+    """
+    Write spans as Chrome trace-event JSON ("X" complete events, microseconds).
+    """
+    if span_records is None:
+        span_records = records()
+    events = []
+    for record in span_records:
+        args = dict(record["args"])
+        args.update(cpu_s=round(record["cpu"], 6), rss_delta=record["rss_delta"], items=record["items"])
+        if "error" in record:
+            args["error"] = record["error"]
+        events.append({
+            "name": record["name"],
+            "cat": record["category"],
+            "ph": "X",
+            "ts": record["start"] * 1e6,
+            "dur": record["wall"] * 1e6,
+            "pid": record["pid"],
+            "tid": record["tid"],
+            "args": args,
+        })
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+def write_json(path, span_records=None):
+    """Write the summary table and the raw spans as plain JSON."""
+    if span_records is None:
+        span_records = records()
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"summary": summary(span_records), "spans": span_records}, f, indent=2, default=str)
+
+
+def dump(output_dir, prefix="profile"):
+    """
+    Write <prefix>.trace.json and <prefix>.summary.json into output_dir and
+    return the text summary table.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    span_records = records()
+    write_chrome_trace(os.path.join(output_dir, f"{prefix}.trace.json"), span_records)
+    write_json(os.path.join(output_dir, f"{prefix}.summary.json"), span_records)
+    return format_summary(span_records)
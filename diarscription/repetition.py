@@ -0,0 +1,263 @@
+"""
+Repetition / hallucination check after transcription.
+
+On long CPU runs Whisper sometimes gets stuck and emits the same phrase over
+and over ("thank you thank you thank you ..."), or packs far more words into
+a segment than anyone can say. Rerunning the whole file with another model
+fixes that at the cost of a full transcription. This module instead:
+
+1. finds repeated n-gram runs in the word stream, by comparing rolling hashes
+   of every n-gram with the n-gram n words later (n = 1..MAX_PERIOD), and
+   segments with an implausible words-per-second rate
+2. re-decodes only the flagged time windows with different decoder settings
+   (sampling temperatures, or another model)
+3. splices the re-decoded segments back in, keeping a window's original text
+   when the retry isn't any better
+
+    python -m diarscription repair meeting.wav out/meeting.json --retry-model large-v2
+
+Run it before diarization: the re-decoded segments have no speakers yet.
+"""
+import numpy as np
+
+from . import profiling
+from . import transcription
+from .audio import SAMPLE_RATE
+
+# Repeats of a 1..MAX_PERIOD word pattern in a row that count as a loop
+MAX_PERIOD = 8
+MIN_REPEATS = 4
+
+# Normal speech is 2-3 words per second and fast speakers reach about 5;
+# alignment squeezes short segments now and then, so only longer ones are checked
+MAX_WORDS_PER_SECOND = 8.0
+MIN_FAST_WORDS = 8
+
+# Seconds added around a flagged span before re-decoding it
+PADDING = 1.0
+
+# Decoder options for the retry: sample instead of greedy decoding, which
+# usually breaks a loop
+RETRY_ASR_OPTIONS = {"temperatures": [0.2, 0.4, 0.6, 0.8], "condition_on_previous_text": False}
+
+_HASH_BASE = np.uint64(1000003)
+_HASH_BASE_INVERSE = np.uint64(pow(1000003, -1, 1 << 64))
+
+
+def word_stream(segments):
+    """
+    Flatten segments into (term ids, vocabulary, word starts, word ends, segment index) arrays.
+    Segments without word timings (unaligned output) have their words spread
+    evenly over the segment.
+    """
+    from .autotune import normalize_words
+
+    vocabulary = {}
+    ids, starts, ends, owners = [], [], [], []
+    for index, segment in enumerate(segments):
+        words = segment.get("words")
+        if words:
+            timed = []
+            start = segment.get("start", 0.0)
+            for word in words:
+                start = word.get("start", start)
+                end = word.get("end", start)
+                timed.extend((term, start, end) for term in normalize_words(word["word"]))
+        else:
+            terms = normalize_words(segment.get("text", ""))
+            step = (segment["end"] - segment["start"]) / max(len(terms), 1)
+            timed = [(term, segment["start"] + i * step, segment["start"] + (i + 1) * step)
+                     for i, term in enumerate(terms)]
+        for term, start, end in timed:
+            ids.append(vocabulary.setdefault(term, len(vocabulary) + 1))
+            starts.append(start)
+            ends.append(end)
+            owners.append(index)
+    return (np.array(ids, dtype=np.uint64), vocabulary, np.array(starts, dtype=np.float64),
+            np.array(ends, dtype=np.float64), np.array(owners, dtype=np.int64))
+
+
+def ngram_hashes(ids, n, prefix=None, powers=None):
+    """
+    Polynomial hash of every n-gram of ids (wrapping uint64 arithmetic).
+
+    With prefix[k] = sum(ids[j] * B^-j for j < k), the hash of ids[i:i+n] is
+    (prefix[i+n] - prefix[i]) * B^i, so every n-gram hash comes out of one
+    subtraction; prefix and powers can be shared across calls for the same ids.
+    """
+    if prefix is None:
+        prefix, powers = _hash_prefix(ids)
+    count = len(ids) - n + 1
+    if count <= 0:
+        return np.empty(0, dtype=np.uint64)
+    return (prefix[n:n + count] - prefix[:count]) * powers[:count]
+
+
+def _hash_prefix(ids):
+    with np.errstate(over="ignore"):
+        inverse_powers = np.cumprod(np.full(len(ids), _HASH_BASE_INVERSE, dtype=np.uint64)) * _HASH_BASE
+        powers = np.cumprod(np.full(len(ids), _HASH_BASE, dtype=np.uint64)) * _HASH_BASE_INVERSE
+        prefix = np.concatenate(([np.uint64(0)], np.cumsum(ids * inverse_powers, dtype=np.uint64)))
+    return prefix, powers
+
+
+def _runs(mask):
+    """(start, length) of every run of True in a boolean array."""
+    edges = np.diff(np.concatenate(([0], mask.view(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    return starts, np.flatnonzero(edges == -1) - starts
+
+
+def find_repeats(ids, max_period=MAX_PERIOD, min_repeats=MIN_REPEATS):
+    """
+    Find runs where a pattern of 1..max_period words repeats at least
+    min_repeats times back to back.
+
+    For period p, the n-gram hashes h_p satisfy h_p[i] == h_p[i + p] all the way
+    through a loop, so a loop shows up as a run of equal hashes p apart.
+
+    Returns:
+        List of (first word, last word + 1, period) spans
+    """
+    if not len(ids):
+        return []
+    prefix, powers = _hash_prefix(ids)
+    spans = []
+    with np.errstate(over="ignore"):
+        for period in range(1, max_period + 1):
+            hashes = ngram_hashes(ids, period, prefix, powers)
+            if len(hashes) <= period:
+                break
+            starts, lengths = _runs(hashes[:-period] == hashes[period:])
+            covered = lengths + 2 * period - 1
+            looped = covered >= min_repeats * period
+            for start, length in zip(starts[looped], covered[looped]):
+                # rule out hash collisions before trusting the run
+                if not np.array_equal(ids[start:start + length - period], ids[start + period:start + length]):
+                    continue
+                # a loop of period p also repeats with period 2p, 3p, ...; report it once
+                if not any(first <= start and start + length <= last for first, last, _ in spans):
+                    spans.append((int(start), int(start + length), period))
+    return spans
+
+
+def find_fast_segments(segments, max_words_per_second=MAX_WORDS_PER_SECOND, counts=None):
+    """Indices of segments with more words per second than anyone speaks."""
+    flagged = []
+    for index, segment in enumerate(segments):
+        words = counts[index] if counts is not None else len(segment.get("text", "").split())
+        duration = segment["end"] - segment["start"]
+        if words >= MIN_FAST_WORDS and words > max_words_per_second * max(duration, 0.1):
+            flagged.append(index)
+    return flagged
+
+
+def flag_windows(segments, max_period=MAX_PERIOD, min_repeats=MIN_REPEATS,
+                 max_words_per_second=MAX_WORDS_PER_SECOND, padding=PADDING):
+    """
+    Time windows that need re-decoding.
+
+    Each flagged span is widened to whole segments plus padding, and
+    overlapping windows are merged.
+
+    Returns:
+        List of {"start", "end", "span_start", "span_end", "reasons"} dicts in
+        time order; start/end include the padding, span_start/span_end are the
+        flagged segments themselves
+    """
+    with profiling.span("detect_repeats", items=len(segments)) as span:
+        ids, _, _, _, owners = word_stream(segments)
+        span.add_items(len(ids))
+        counts = np.bincount(owners, minlength=len(segments))
+
+        flagged = []  # (first segment, last segment, reason)
+        for first, last, period in find_repeats(ids, max_period, min_repeats):
+            repeats = (last - first) // period
+            flagged.append((owners[first], owners[last - 1], f"{period}-word pattern repeated {repeats}x"))
+        for index in find_fast_segments(segments, max_words_per_second, counts):
+            duration = segments[index]["end"] - segments[index]["start"]
+            flagged.append((index, index, f"{counts[index]} words in {duration:.1f}s"))
+
+    windows = []
+    for first, last, reason in sorted(flagged):
+        start = max(0.0, segments[first]["start"] - padding)
+        end = segments[last]["end"] + padding
+        if windows and start <= windows[-1]["end"]:
+            windows[-1]["end"] = max(windows[-1]["end"], end)
+            windows[-1]["span_end"] = max(windows[-1]["span_end"], segments[last]["end"])
+            windows[-1]["reasons"].append(reason)
+        else:
+            windows.append({"start": start, "end": end, "span_start": segments[first]["start"],
+                            "span_end": segments[last]["end"], "reasons": [reason]})
+    return windows
+
+
+def _score(segments, max_period, min_repeats, max_words_per_second):
+    """Number of words in loops or too-fast segments; lower is better."""
+    ids, _, _, _, owners = word_stream(segments)
+    counts = np.bincount(owners, minlength=len(segments))
+    looped = sum(last - first for first, last, _ in find_repeats(ids, max_period, min_repeats))
+    fast = sum(int(counts[index]) for index in find_fast_segments(segments, max_words_per_second, counts))
+    return looped + fast
+
+
+def repair(result, audio, model, device=transcription.DEVICE, batch_size=transcription.BATCH_SIZE,
+           chunk_size=transcription.CHUNK_SIZE, align=True, max_period=MAX_PERIOD, min_repeats=MIN_REPEATS,
+           max_words_per_second=MAX_WORDS_PER_SECOND, padding=PADDING, allow_delete=False, log=print):
+    """
+    Re-decode the flagged windows of a whisperx result and splice the new
+    segments in place of the old ones.
+
+    Args:
+        result: whisperx result (aligned or not)
+        audio: The 16kHz float32 samples the result was transcribed from
+        model: whisperx model for the retry, with different decoder settings
+            (RETRY_ASR_OPTIONS, via load_model() or, to reuse the first pass's
+            model, transcription.set_asr_options()) or a different model
+        align: Word-align the re-decoded segments (do this if result was aligned)
+        allow_delete: Accept a retry that decodes nothing in a window, which
+            deletes the window's original segments. Off by default: an empty
+            retry scores 0 and would otherwise always win
+
+    Returns:
+        (repaired result, report dict with the windows and the share of audio re-decoded)
+    """
+    segments = result["segments"]
+    windows = flag_windows(segments, max_period, min_repeats, max_words_per_second, padding)
+    duration = len(audio) / SAMPLE_RATE
+    report = {"windows": windows, "redecoded_seconds": 0.0, "duration": duration, "replaced": 0}
+    if not windows:
+        return result, report
+
+    with profiling.span("redecode", items=len(windows)):
+        retried = transcription.transcribe_windows(model, audio, windows, language=result.get("language"),
+                                                   device=device, batch_size=batch_size, chunk_size=chunk_size,
+                                                   align_words=align)
+    report["redecoded_seconds"] = sum(min(window["end"], duration) - window["start"] for window in windows)
+
+    with profiling.span("splice"):
+        kept = list(segments)
+        for window, new_segments in zip(windows, retried):
+            # padding words belong to the neighbouring segments, which stay
+            span = {"start": window["span_start"], "end": window["span_end"]}
+            old_segments = transcription.window_segments(segments, span)
+            new_segments = transcription.clip_segments(new_segments, span["start"], span["end"])
+            old_score = _score(old_segments, max_period, min_repeats, max_words_per_second)
+            new_score = _score(new_segments, max_period, min_repeats, max_words_per_second)
+            window.update(old_score=old_score, new_score=new_score,
+                          replaced=new_score < old_score and (bool(new_segments) or allow_delete))
+            if not window["replaced"]:
+                reason = "retry decoded nothing" if not new_segments else "retry not better"
+                log(f"  {window['start']:.1f}-{window['end']:.1f}s: {reason}, kept the original")
+                continue
+            old_ids = {id(segment) for segment in old_segments}
+            kept = [segment for segment in kept if id(segment) not in old_ids] + new_segments
+            report["replaced"] += 1
+            log(f"  {window['start']:.1f}-{window['end']:.1f}s: {'; '.join(window['reasons'])} -> re-decoded")
+        kept.sort(key=lambda segment: segment["start"])
+
+    repaired = dict(result, segments=kept)
+    if "word_segments" in result:
+        repaired["word_segments"] = [word for segment in kept for word in segment.get("words", [])]
+    report["redecoded_fraction"] = report["redecoded_seconds"] / duration if duration else 0.0
+    return repaired, report
@@ -0,0 +1,263 @@
+"""
+Positional inverted index over word-level WhisperX output (topic 9's
+"searching for specific words").
+
+    python -m diarscription index search-index docs/reference/audio/*/whisperx/*.json
+    python -m diarscription search search-index "hardening sprint"
+    python -m diarscription search search-index "payroll fidelity" --near 10 --speaker SPEAKER_01
+
+Every normalized word becomes a posting (meeting, word position, start ms,
+end ms, speaker). Postings are sorted by term, then meeting and position, and
+stored as one NumPy structured array per index segment. The array is opened
+with mmap_mode="r", and a JSON lexicon maps each term to its slice of it.
+
+Adding meetings writes a new segment, so existing data isn't rewritten.
+Queries read every segment, and `index --optimize` merges them into one.
+
+Phrase queries intersect position lists (position + i for the i-th word) and
+proximity queries binary-search one term's postings for another's within k
+words, both vectorized over all postings of the terms involved.
+"""
+import glob
+import json
+import os
+import re
+
+import numpy as np
+
+from . import profiling
+
+POSTING = np.dtype([("meeting", "<i4"), ("position", "<i4"), ("start_ms", "<i4"), ("end_ms", "<i4"),
+                    ("speaker", "<i2")])
+
+WORD = re.compile(r"[a-z0-9']+")
+
+
+def normalize(text):
+    return WORD.findall(text.lower())
+
+
+def _keys(postings):
+    """(meeting, position) packed into one sortable int64."""
+    return (postings["meeting"].astype(np.int64) << 32) | postings["position"].astype(np.int64)
+
+
+def meeting_words(whisperx_data):
+    """
+    Yield (word text, start, end, speaker) for every word of a whisperx result.
+    Words alignment missed get the previous word's time (or the segment's).
+    """
+    for segment in whisperx_data["segments"]:
+        start = segment.get("start", 0.0)
+        end = segment.get("end", start)
+        for word in segment.get("words", []):
+            start = word.get("start", start)
+            end = word.get("end", max(start, end))
+            yield word["word"], start, end, word.get("speaker", segment.get("speaker", "Unknown"))
+
+
+class TranscriptIndex:
+    """
+    An on-disk positional index. Opening it only reads the small JSON files;
+    the postings are memory-mapped.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.meetings = []
+        self.speakers = []
+        self.segments = []
+        self.next_segment = 1
+        if os.path.exists(os.path.join(path, "index.json")):
+            with open(os.path.join(path, "index.json"), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            self.meetings = meta["meetings"]
+            self.speakers = meta["speakers"]
+            self.next_segment = meta["next_segment"]
+            for name in meta["segments"]:
+                self.segments.append(self._open_segment(name))
+
+    def _open_segment(self, name):
+        with open(os.path.join(self.path, f"{name}.lexicon.json"), "r", encoding="utf-8") as f:
+            lexicon = json.load(f)
+        postings = np.load(os.path.join(self.path, f"{name}.postings.npy"), mmap_mode="r")
+        return {"name": name, "lexicon": lexicon, "postings": postings}
+
+    def _save_meta(self):
+        temp = os.path.join(self.path, "index.json.tmp")
+        with open(temp, "w", encoding="utf-8") as f:
+            json.dump({"meetings": self.meetings, "speakers": self.speakers,
+                       "segments": [segment["name"] for segment in self.segments],
+                       "next_segment": self.next_segment}, f, indent=2)
+        os.replace(temp, os.path.join(self.path, "index.json"))
+
+    def _write_segment(self, postings, terms):
+        """
+        Sort postings by (term, meeting, position) and write them as a new segment.
+        `terms` holds the term of every posting.
+        """
+        order = np.lexsort((postings["position"], postings["meeting"], terms))
+        postings = postings[order]
+        terms = terms[order]
+
+        lexicon = {}
+        if len(terms):
+            boundaries = np.flatnonzero(terms[1:] != terms[:-1]) + 1
+            starts = np.concatenate(([0], boundaries))
+            stops = np.concatenate((boundaries, [len(terms)]))
+            lexicon = {str(terms[start]): [int(start), int(stop)] for start, stop in zip(starts, stops)}
+
+        name = f"seg_{self.next_segment:04d}"
+        self.next_segment += 1
+        np.save(os.path.join(self.path, f"{name}.postings.npy"), postings)
+        with open(os.path.join(self.path, f"{name}.lexicon.json"), "w", encoding="utf-8") as f:
+            json.dump(lexicon, f)
+        return self._open_segment(name)
+
+    def add_meetings(self, meetings):
+        """
+        Index new meetings as one new segment.
+
+        Args:
+            meetings: {meeting name: whisperx result dict}. Meetings already in
+                the index are skipped
+
+        Returns:
+            Number of words indexed
+        """
+        os.makedirs(self.path, exist_ok=True)
+        speaker_ids = {speaker: i for i, speaker in enumerate(self.speakers)}
+        rows = []
+        terms = []
+
+        with profiling.span("index_meetings", items=len(meetings)) as span:
+            for name, whisperx_data in meetings.items():
+                if name in self.meetings:
+                    continue
+                meeting_id = len(self.meetings)
+                self.meetings.append(name)
+                position = 0
+                for text, start, end, speaker in meeting_words(whisperx_data):
+                    if speaker not in speaker_ids:
+                        speaker_ids[speaker] = len(self.speakers)
+                        self.speakers.append(speaker)
+                    for term in normalize(text):
+                        rows.append((meeting_id, position, int(round(start * 1000)), int(round(end * 1000)),
+                                     speaker_ids[speaker]))
+                        terms.append(term)
+                        position += 1
+            span.add_items(len(rows))
+
+            if rows:
+                self.segments.append(self._write_segment(np.array(rows, dtype=POSTING), np.array(terms)))
+            self._save_meta()
+        return len(rows)
+
+    def add_files(self, paths):
+        meetings = {}
+        for path in paths:
+            with open(path, "r", encoding="utf-8") as f:
+                meetings[os.path.splitext(os.path.basename(path))[0]] = json.load(f)
+        return self.add_meetings(meetings)
+
+    def optimize(self):
+        """Merge all segments into one."""
+        if len(self.segments) < 2:
+            return
+        postings = []
+        terms = []
+        for segment in self.segments:
+            for term, (start, stop) in segment["lexicon"].items():
+                postings.append(np.asarray(segment["postings"][start:stop]))
+                terms.append(np.full(stop - start, term, dtype=object))
+        old = [segment["name"] for segment in self.segments]
+        self.segments = []
+        merged = self._write_segment(np.concatenate(postings), np.concatenate(terms).astype(str))
+        self.segments = [merged]
+        self._save_meta()
+        for name in old:
+            os.remove(os.path.join(self.path, f"{name}.postings.npy"))
+            os.remove(os.path.join(self.path, f"{name}.lexicon.json"))
+
+    def postings(self, term):
+        """All postings of one (normalized) term across segments, sorted by meeting and position."""
+        parts = []
+        for segment in self.segments:
+            span = segment["lexicon"].get(term)
+            if span:
+                parts.append(segment["postings"][span[0]:span[1]])
+        if not parts:
+            return np.empty(0, dtype=POSTING)
+        if len(parts) == 1:
+            return parts[0]
+        merged = np.concatenate(parts)
+        return merged[np.argsort(_keys(merged), kind="stable")]
+
+    def _filter(self, postings, meetings=None, speakers=None, start_ms=None, end_ms=None):
+        mask = np.ones(len(postings), dtype=bool)
+        if meetings:
+            ids = [self.meetings.index(name) for name in meetings if name in self.meetings]
+            mask &= np.isin(postings["meeting"], ids)
+        if speakers:
+            ids = [self.speakers.index(name) for name in speakers if name in self.speakers]
+            mask &= np.isin(postings["speaker"], ids)
+        if start_ms is not None:
+            mask &= postings["start_ms"] >= start_ms
+        if end_ms is not None:
+            mask &= postings["start_ms"] < end_ms
+        return postings[mask]
+
+    def phrase(self, query):
+        """
+        Postings of the first word of every exact occurrence of the phrase.
+        """
+        terms = normalize(query)
+        if not terms:
+            return np.empty(0, dtype=POSTING)
+        first = self.postings(terms[0])
+        candidates = _keys(first)
+        keep = np.ones(len(first), dtype=bool)
+        for offset, term in enumerate(terms[1:], 1):
+            keep &= np.isin(candidates + offset, _keys(self.postings(term)))
+        return first[keep]
+
+    def near(self, query, distance):
+        """
+        Postings of the first query word wherever every other query word occurs
+        within `distance` words of it (either side, same meeting). Each query
+        word needs its own occurrence: "the the" needs two different "the"s in
+        the window, one of them the first word itself.
+        """
+        terms = normalize(query)
+        if not terms:
+            return np.empty(0, dtype=POSTING)
+        first = self.postings(terms[0])
+        candidates = _keys(first)
+        keep = np.ones(len(first), dtype=bool)
+        # different words never share a position, so counting occurrences per
+        # distinct word in the window is enough
+        for term in dict.fromkeys(terms):
+            needed = terms.count(term)
+            if term == terms[0] and needed == 1:
+                continue
+            other = _keys(self.postings(term))
+            low = np.searchsorted(other, candidates - distance, side="left")
+            high = np.searchsorted(other, candidates + distance, side="right")
+            keep &= high - low >= needed
+        return first[keep]
+
+    def search(self, query, near=None, meetings=None, speakers=None, start_ms=None, end_ms=None):
+        """
+        Run a phrase query (or a proximity query with near=k) and return hits as
+        dicts with meeting, position, start_ms, end_ms and speaker, in meeting/time order.
+        """
+        with profiling.span("search") as span:
+            hits = self.near(query, near) if near else self.phrase(query)
+            hits = self._filter(hits, meetings, speakers, start_ms, end_ms)
+            span.add_items(len(hits))
+        return [{"meeting": self.meetings[hit["meeting"]], "position": int(hit["position"]),
+                 "start_ms": int(hit["start_ms"]), "end_ms": int(hit["end_ms"]),
+                 "speaker": self.speakers[hit["speaker"]]} for hit in hits]
+
+
+def find_whisperx_files(root):
+    return sorted(glob.glob(os.path.join(root, "*", "whisperx", "*.json")))
@@ -0,0 +1,250 @@
+"""
+Cross-meeting speaker registry.
+
+Diarization labels (SPEAKER_00, SPEAKER_01, ...) only mean something inside one
+file. The registry keeps a voice embedding centroid plus a few exemplars for
+every known person and maps the clusters of a new meeting onto them.
+
+On disk a registry is a directory:
+
+    centroids.npy    float32 (identities x dim), running mean of unit embeddings
+    counts.npy       float32 (identities,), number of clusters merged into each centroid
+    exemplars.npy    float32 (exemplars x dim), unit embeddings
+    owners.npy       int32 (exemplars,), identity index of each exemplar
+    identities.json  names and the meetings each identity was seen in
+
+The matrices are contiguous, so matching a meeting is one matrix product per
+matrix no matter how many identities are archived, and they are opened with
+mmap_mode="r" so read-only lookups don't copy them into memory.
+"""
+import json
+import os
+
+import numpy as np
+
+THRESHOLD = 0.6
+MAX_EXEMPLARS = 8
+
+
+def _unit(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class _Rows:
+    """
+    A float32/int32 matrix that grows by appending rows, with capacity doubling
+    so that adding identities one at a time stays amortized O(1).
+    """
+    def __init__(self, data):
+        self._data = data
+        self._size = len(data)
+
+    @property
+    def view(self):
+        return self._data[:self._size]
+
+    def __len__(self):
+        return self._size
+
+    def append(self, row):
+        if self._size == len(self._data):
+            grown = np.empty((max(8, 2 * len(self._data)),) + self._data.shape[1:], dtype=self._data.dtype)
+            grown[:self._size] = self._data[:self._size]
+            self._data = grown
+        elif not self._data.flags.writeable:
+            self._data = np.array(self._data)
+        self._data[self._size] = row
+        self._size += 1
+
+    def writable(self):
+        if not self._data.flags.writeable:
+            self._data = np.array(self._data)
+        return self.view
+
+
+class SpeakerRegistry:
+    """
+    Speaker identities shared across meetings.
+
+    Args:
+        path: Registry directory (created on save())
+        dim: Embedding size; only needed for an empty registry, otherwise
+            taken from the first embedding added
+        mmap: Open the matrices read-only memory-mapped (copied on first write)
+    """
+    def __init__(self, path, dim=None, mmap=True):
+        self.path = path
+        mode = "r" if mmap else None
+        if os.path.exists(os.path.join(path, "centroids.npy")):
+            with open(os.path.join(path, "identities.json"), "r", encoding="utf-8") as f:
+                self.identities = json.load(f)
+            self._centroids = _Rows(np.load(os.path.join(path, "centroids.npy"), mmap_mode=mode))
+            self._counts = _Rows(np.load(os.path.join(path, "counts.npy"), mmap_mode=mode))
+            self._exemplars = _Rows(np.load(os.path.join(path, "exemplars.npy"), mmap_mode=mode))
+            self._owners = _Rows(np.load(os.path.join(path, "owners.npy"), mmap_mode=mode))
+            self.dim = self._centroids.view.shape[1]
+        else:
+            self.identities = []
+            self.dim = dim
+            if dim is not None:
+                self._allocate(dim)
+        self._unit_centroids = None
+
+    def _allocate(self, dim):
+        self.dim = dim
+        self._centroids = _Rows(np.empty((0, dim), dtype=np.float32))
+        self._counts = _Rows(np.empty((0,), dtype=np.float32))
+        self._exemplars = _Rows(np.empty((0, dim), dtype=np.float32))
+        self._owners = _Rows(np.empty((0,), dtype=np.int32))
+
+    def __len__(self):
+        return len(self.identities)
+
+    def _replace(self, filename, array):
+        # Write next to the target and swap it in, so a registry that is still
+        # memory-mapped (by this or another process) never sees a half-written file
+        target = os.path.join(self.path, filename)
+        temp = target + ".tmp"
+        with open(temp, "wb") as f:
+            np.save(f, np.ascontiguousarray(array))
+        os.replace(temp, target)
+
+    def save(self):
+        os.makedirs(self.path, exist_ok=True)
+        self._replace("centroids.npy", self._centroids.view)
+        self._replace("counts.npy", self._counts.view)
+        self._replace("exemplars.npy", self._exemplars.view)
+        self._replace("owners.npy", self._owners.view)
+        temp = os.path.join(self.path, "identities.json.tmp")
+        with open(temp, "w", encoding="utf-8") as f:
+            json.dump(self.identities, f, indent=2)
+        os.replace(temp, os.path.join(self.path, "identities.json"))
+
+    def similarities(self, embeddings):
+        """
+        Cosine similarity of each embedding to each identity (clusters x identities).
+        The score for an identity is the best of its centroid and its exemplars.
+        """
+        queries = _unit(np.atleast_2d(embeddings))
+        if not self.identities:
+            return np.empty((len(queries), 0), dtype=np.float32)
+
+        if self._unit_centroids is None:
+            self._unit_centroids = _unit(self._centroids.view)
+        scores = queries @ self._unit_centroids.T
+
+        if len(self._exemplars):
+            exemplar_scores = queries @ self._exemplars.view.T
+            np.maximum.at(scores.T, self._owners.view, exemplar_scores.T)
+        return scores
+
+    def match(self, embeddings, threshold=THRESHOLD):
+        """
+        Map cluster embeddings onto known identities.
+
+        Each identity can be claimed by at most one cluster of the same meeting;
+        pairs are taken greedily from the highest similarity down.
+
+        Returns:
+            List with the identity index (or None) for every embedding, and the
+            similarity matrix
+        """
+        scores = self.similarities(embeddings)
+        assignment = [None] * len(scores)
+        if scores.size == 0:
+            return assignment, scores
+
+        order = np.argsort(scores, axis=None)[::-1]
+        taken = set()
+        for flat in order:
+            cluster, identity = divmod(int(flat), scores.shape[1])
+            if scores[cluster, identity] < threshold:
+                break
+            if assignment[cluster] is None and identity not in taken:
+                assignment[cluster] = identity
+                taken.add(identity)
+        return assignment, scores
+
+    def add_identity(self, embedding, name=None, meeting=None):
+        embedding = _unit(embedding)
+        if self.dim is None:
+            self._allocate(len(embedding))
+        index = len(self.identities)
+        self.identities.append({
+            "name": name or f"PERSON_{index:04d}",
+            "meetings": [meeting] if meeting else [],
+        })
+        self._centroids.append(embedding)
+        self._counts.append(1.0)
+        self._exemplars.append(embedding)
+        self._owners.append(index)
+        self._unit_centroids = None
+        return index
+
+    def update_identity(self, index, embedding, meeting=None):
+        """
+        Fold a new cluster embedding into an identity's running-mean centroid and
+        keep it as an exemplar if it adds variety.
+        """
+        embedding = _unit(embedding)
+        centroids = self._centroids.writable()
+        counts = self._counts.writable()
+        counts[index] += 1.0
+        centroids[index] += (embedding - centroids[index]) / counts[index]
+        self._unit_centroids = None
+
+        if meeting and meeting not in self.identities[index]["meetings"]:
+            self.identities[index]["meetings"].append(meeting)
+
+        owned = np.flatnonzero(self._owners.view == index)
+        if len(owned) < MAX_EXEMPLARS:
+            self._exemplars.append(embedding)
+            self._owners.append(index)
+            return
+
+        # Full: replace the exemplar closest to the centroid (the most redundant
+        # one) if the new embedding is further from the centroid than it is
+        exemplars = self._exemplars.writable()
+        centroid = _unit(centroids[index])
+        closeness = exemplars[owned] @ centroid
+        most_redundant = int(np.argmax(closeness))
+        if float(embedding @ centroid) < closeness[most_redundant]:
+            exemplars[owned[most_redundant]] = embedding
+
+    def label_meeting(self, cluster_embeddings, meeting=None, threshold=THRESHOLD, enroll=True):
+        """
+        Match one meeting's diarization clusters and update the registry.
+
+        Args:
+            cluster_embeddings: {diarization label: embedding}
+            meeting: Meeting name recorded against every identity seen
+            threshold: Minimum cosine similarity to reuse an identity
+            enroll: Create new identities for clusters that match nobody
+
+        Returns:
+            {diarization label: {"identity": index or None, "name": ..., "score": ...}}
+        """
+        labels = sorted(cluster_embeddings)
+        if not labels:
+            return {}
+        embeddings = np.stack([np.asarray(cluster_embeddings[label], dtype=np.float32) for label in labels])
+        assignment, scores = self.match(embeddings, threshold)
+
+        mapping = {}
+        for row, (label, identity) in enumerate(zip(labels, assignment)):
+            score = float(scores[row, identity]) if identity is not None else None
+            if identity is not None:
+                self.update_identity(identity, embeddings[row], meeting)
+            elif enroll:
+                identity = self.add_identity(embeddings[row], meeting=meeting)
+            mapping[label] = {
+                "identity": identity,
+                "name": self.identities[identity]["name"] if identity is not None else None,
+                "score": score,
+            }
+        return mapping
+
+    def rename(self, index, name):
+        self.identities[index]["name"] = name
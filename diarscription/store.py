@@ -0,0 +1,311 @@
+"""
+SQLite results store for transcripts across meetings.
+
+Each meeting's outputs are spread over whisperx JSON, turns JSON,
+formatted_srt.md, token_array.json and final_transcript.srt. Any question
+across meetings therefore means parsing every file again. The store loads
+them once into one database:
+
+    meetings  id, name, source, language, duration_ms
+    segments  meeting_id, start_ms, end_ms, speaker, text, talk_ms
+    words     meeting_id, segment_id, position, start_ms, end_ms, speaker, token, text, score
+    turns     meeting_id, start_ms, end_ms, speaker
+
+    python -m diarscription db results.sqlite load docs/reference/audio/sample-*
+    python -m diarscription db results.sqlite talk-time
+    python -m diarscription db results.sqlite words --meeting sample-b --start 60 --end 90
+    python -m diarscription db results.sqlite find sprint --speaker SPEAKER_01
+
+Times are integer milliseconds. `token` is the lower-cased word with its
+punctuation stripped, so lookups don't depend on how whisper punctuated.
+Duplicate and overlapping turns of one speaker are merged when they are
+loaded, and each segment keeps in talk_ms the part of it that earlier
+segments of its speaker don't cover, so talk time is a plain sum. Loading a meeting replaces any earlier
+copy of it and happens in one transaction with executemany. The queries are fixed SQL strings, which
+sqlite3 keeps prepared in its statement cache, and each is backed by one of
+the indexes in SCHEMA.
+"""
+import json
+import os
+import re
+import sqlite3
+
+import numpy as np
+
+from . import profiling
+from .tokens import SRT_LINE
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meetings (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    source TEXT,
+    language TEXT,
+    duration_ms INTEGER
+);
+CREATE TABLE IF NOT EXISTS segments (
+    id INTEGER PRIMARY KEY,
+    meeting_id INTEGER NOT NULL REFERENCES meetings (id),
+    start_ms INTEGER NOT NULL,
+    end_ms INTEGER NOT NULL,
+    speaker TEXT,
+    text TEXT NOT NULL,
+    talk_ms INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS words (
+    id INTEGER PRIMARY KEY,
+    meeting_id INTEGER NOT NULL REFERENCES meetings (id),
+    segment_id INTEGER NOT NULL REFERENCES segments (id),
+    position INTEGER NOT NULL,
+    start_ms INTEGER,
+    end_ms INTEGER,
+    speaker TEXT,
+    token TEXT NOT NULL,
+    text TEXT NOT NULL,
+    score REAL
+);
+CREATE TABLE IF NOT EXISTS turns (
+    id INTEGER PRIMARY KEY,
+    meeting_id INTEGER NOT NULL REFERENCES meetings (id),
+    start_ms INTEGER NOT NULL,
+    end_ms INTEGER NOT NULL,
+    speaker TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS segments_time ON segments (meeting_id, start_ms);
+CREATE INDEX IF NOT EXISTS segments_speaker ON segments (speaker, meeting_id);
+CREATE INDEX IF NOT EXISTS words_time ON words (meeting_id, start_ms);
+CREATE INDEX IF NOT EXISTS words_speaker ON words (speaker, meeting_id);
+CREATE INDEX IF NOT EXISTS words_token ON words (token);
+CREATE INDEX IF NOT EXISTS turns_time ON turns (meeting_id, start_ms);
+CREATE INDEX IF NOT EXISTS turns_speaker ON turns (speaker, meeting_id, start_ms, end_ms);
+CREATE INDEX IF NOT EXISTS segments_talk ON segments (meeting_id, speaker, talk_ms);
+CREATE INDEX IF NOT EXISTS turns_talk ON turns (meeting_id, speaker, start_ms, end_ms);
+"""
+
+TOKEN = re.compile(r"[^a-z0-9']+")
+
+# Talk time per row: turns don't overlap once merged, segments carry their share
+TALK_LENGTH = {"turns": "t.end_ms - t.start_ms", "segments": "t.talk_ms"}
+
+# Queries. Time ranges select rows that start inside [start_ms, end_ms).
+WORDS_BETWEEN = ("SELECT w.start_ms, w.end_ms, w.speaker, w.text, w.score FROM words w "
+                 "WHERE w.meeting_id = ? AND w.start_ms >= ? AND w.start_ms < ? ORDER BY w.start_ms")
+SEGMENTS_BETWEEN = ("SELECT s.start_ms, s.end_ms, s.speaker, s.text FROM segments s "
+                    "WHERE s.meeting_id = ? AND s.start_ms >= ? AND s.start_ms < ? ORDER BY s.start_ms")
+SPEAKER_SEGMENTS = ("SELECT m.name, s.start_ms, s.end_ms, s.text FROM segments s "
+                    "JOIN meetings m ON m.id = s.meeting_id WHERE s.speaker = ? ORDER BY m.name, s.start_ms")
+FIND_TOKEN = ("SELECT m.name, w.start_ms, w.end_ms, w.speaker, w.text FROM words w "
+              "JOIN meetings m ON m.id = w.meeting_id WHERE w.token = ? ORDER BY m.name, w.start_ms")
+FIND_TOKEN_BY_SPEAKER = ("SELECT m.name, w.start_ms, w.end_ms, w.speaker, w.text FROM words w "
+                         "JOIN meetings m ON m.id = w.meeting_id WHERE w.token = ? AND w.speaker = ? "
+                         "ORDER BY m.name, w.start_ms")
+TALK_TIME = ("SELECT m.name, t.speaker, SUM({length}), COUNT(*) FROM {table} t "
+             "JOIN meetings m ON m.id = t.meeting_id {where} GROUP BY t.meeting_id, t.speaker "
+             "ORDER BY m.name, t.speaker")
+
+
+def normalize_token(text):
+    return TOKEN.sub("", text.lower())
+
+
+def _ms(seconds):
+    return None if seconds is None or seconds != seconds else int(round(seconds * 1000))
+
+
+def turns_from_formatted_srt(text):
+    """
+    Speaker turns ({start, end, speaker}, seconds) from a formatted_srt.md file.
+    A cue repeats its time range on every line, so each speaker gets one turn
+    per cue however many lines they have in it.
+    """
+    turns = []
+    seen = set()
+    for line in text.splitlines():
+        match = SRT_LINE.match(line.strip())
+        if match:
+            h, m, s, ms, eh, em, es, ems = map(int, match.groups()[0:8])
+            key = (match.groups()[0:8], int(match.group(9)))
+            if key in seen:
+                continue
+            seen.add(key)
+            turns.append({"start": h * 3600 + m * 60 + s + ms / 1000.0,
+                          "end": eh * 3600 + em * 60 + es + ems / 1000.0,
+                          "speaker": f"SPEAKER_{int(match.group(9)):02d}"})
+    return turns
+
+
+def merge_turns(turns):
+    """
+    (start_ms, end_ms, speaker) rows in time order, with duplicate and
+    overlapping turns of the same speaker joined into one. Turns that only
+    touch stay apart.
+    """
+    merged = []
+    last_by_speaker = {}
+    for start_ms, end_ms, speaker in sorted((_ms(turn["start"]), _ms(turn["end"]), turn["speaker"])
+                                            for turn in turns):
+        previous = last_by_speaker.get(speaker)
+        if previous is not None and start_ms < previous[1]:
+            previous[1] = max(previous[1], end_ms)
+            continue
+        last_by_speaker[speaker] = [start_ms, end_ms, speaker]
+        merged.append(last_by_speaker[speaker])
+    return [tuple(turn) for turn in merged]
+
+
+class ResultsStore:
+    """
+    Args:
+        path: SQLite database file (created if missing)
+    """
+    def __init__(self, path):
+        self.path = path
+        self._db = sqlite3.connect(path, cached_statements=256)
+        self._db.execute("PRAGMA journal_mode = WAL")
+        self._db.execute("PRAGMA synchronous = NORMAL")
+        self._db.execute("PRAGMA foreign_keys = ON")
+        self._db.executescript(SCHEMA)
+
+    def close(self):
+        self._db.close()
+
+    def meeting_id(self, name):
+        row = self._db.execute("SELECT id FROM meetings WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            raise Exception(f"No meeting named {name!r} in {self.path}")
+        return row[0]
+
+    def meetings(self):
+        return [row[0] for row in self._db.execute("SELECT name FROM meetings ORDER BY name")]
+
+    def load_meeting(self, name, transcript=None, turns=None, source=None):
+        """
+        Store one meeting, replacing any earlier copy.
+
+        Args:
+            name: Meeting name
+            transcript: ingest.Transcript of the whisperx output (segments and words)
+            turns: Diarization turns as {start, end, speaker} dicts in seconds;
+                overlapping turns of one speaker are stored as one (merge_turns())
+
+        Returns:
+            (segments, words, turns) row counts
+        """
+        turns = turns or []
+        ends = [turn["end"] for turn in turns]
+        turns = merge_turns(turns)
+        counts = (0, 0, len(turns))
+        with profiling.span("store_meeting", meeting=name) as span, self._db:
+            self._db.execute("DELETE FROM words WHERE meeting_id IN (SELECT id FROM meetings WHERE name = ?)", (name,))
+            self._db.execute("DELETE FROM segments WHERE meeting_id IN (SELECT id FROM meetings WHERE name = ?)",
+                             (name,))
+            self._db.execute("DELETE FROM turns WHERE meeting_id IN (SELECT id FROM meetings WHERE name = ?)", (name,))
+            self._db.execute("DELETE FROM meetings WHERE name = ?", (name,))
+
+            if transcript is not None and len(transcript.segments):
+                ends.append(float(np.nanmax(transcript.segments["end"])))
+            cursor = self._db.execute("INSERT INTO meetings (name, source, language, duration_ms) VALUES (?, ?, ?, ?)",
+                                      (name, source, transcript.language if transcript is not None else None,
+                                       _ms(max(ends)) if ends else None))
+            meeting_id = cursor.lastrowid
+
+            if transcript is not None:
+                counts = self._insert_transcript(meeting_id, transcript) + (len(turns),)
+            self._db.executemany("INSERT INTO turns (meeting_id, start_ms, end_ms, speaker) VALUES (?, ?, ?, ?)",
+                                 [(meeting_id,) + turn for turn in turns])
+            span.add_items(sum(counts))
+        return counts
+
+    def _insert_transcript(self, meeting_id, transcript):
+        # Segment ids are assigned here so word rows can point at them without a
+        # round trip per segment
+        first_id = (self._db.execute("SELECT COALESCE(MAX(id), 0) FROM segments").fetchone()[0]) + 1
+        segments = transcript.segments
+        speakers = transcript.speakers + [None]  # code -1 -> None
+        starts = [_ms(start) for start in segments["start"].tolist()]
+        ends = [_ms(end) for end in segments["end"].tolist()]
+        codes = segments["speaker"].tolist()
+
+        # whisperx segments of one speaker can overlap a little; each keeps only
+        # the part that the speaker's earlier segments don't cover
+        talk = [0] * len(starts)
+        reach = {}
+        for i in sorted(range(len(starts)), key=lambda i: starts[i]):
+            if ends[i] is not None:
+                talk[i] = max(ends[i] - max(starts[i], reach.get(codes[i], starts[i])), 0)
+                reach[codes[i]] = max(reach.get(codes[i], ends[i]), ends[i])
+
+        segment_rows = [(first_id + i, meeting_id, starts[i], ends[i], speakers[codes[i]],
+                         transcript.segment_text(i).strip(), talk[i])
+                        for i in range(len(starts))]
+        self._db.executemany("INSERT INTO segments (id, meeting_id, start_ms, end_ms, speaker, text, talk_ms) "
+                             "VALUES (?, ?, ?, ?, ?, ?, ?)", segment_rows)
+
+        words = transcript.words
+        texts = [transcript.word_text(i) for i in range(len(words))]
+        word_rows = [(meeting_id, first_id + segment, position, _ms(start), _ms(end), speakers[code],
+                      normalize_token(text), text, None if score != score else score)
+                     for position, (start, end, score, segment, code, text)
+                     in enumerate(zip(words["start"].tolist(), words["end"].tolist(), words["score"].tolist(),
+                                      words["segment"].tolist(), words["speaker"].tolist(), texts))]
+        self._db.executemany("INSERT INTO words (meeting_id, segment_id, position, start_ms, end_ms, speaker, token, "
+                             "text, score) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", word_rows)
+        return len(segment_rows), len(word_rows)
+
+    def load_sample(self, sample_dir, name=None):
+        """
+        Load one meeting directory: whisperx/*.json for segments and words, and
+        *.turns.json (from `diarize`) or formatted_srt.md for the speaker turns.
+        """
+        from . import ingest
+
+        name = name or os.path.basename(os.path.normpath(sample_dir))
+        transcript = None
+        jsons = sorted(path for path in os.listdir(os.path.join(sample_dir, "whisperx"))
+                       if path.endswith(".json")) if os.path.isdir(os.path.join(sample_dir, "whisperx")) else []
+        if jsons:
+            transcript = ingest.load_whisperx(os.path.join(sample_dir, "whisperx", jsons[0]))
+
+        turns = None
+        turn_files = sorted(path for path in os.listdir(sample_dir) if path.endswith(".turns.json"))
+        if turn_files:
+            with open(os.path.join(sample_dir, turn_files[0]), "r", encoding="utf-8") as f:
+                turns = [dict(turn, speaker=turn.get("identity") or turn["speaker"]) for turn in json.load(f)]
+        elif os.path.isfile(os.path.join(sample_dir, "formatted_srt.md")):
+            with open(os.path.join(sample_dir, "formatted_srt.md"), "r", encoding="utf-8") as f:
+                turns = turns_from_formatted_srt(f.read())
+
+        if transcript is None and not turns:
+            raise Exception(f"{sample_dir}: no whisperx JSON, turns JSON or formatted_srt.md")
+        return self.load_meeting(name, transcript, turns, source=os.path.abspath(sample_dir))
+
+    # Queries
+
+    def words_between(self, meeting, start_ms, end_ms):
+        return self._db.execute(WORDS_BETWEEN, (self.meeting_id(meeting), start_ms, end_ms)).fetchall()
+
+    def segments_between(self, meeting, start_ms, end_ms):
+        return self._db.execute(SEGMENTS_BETWEEN, (self.meeting_id(meeting), start_ms, end_ms)).fetchall()
+
+    def speaker_segments(self, speaker):
+        return self._db.execute(SPEAKER_SEGMENTS, (speaker,)).fetchall()
+
+    def find(self, word, speaker=None):
+        token = normalize_token(word)
+        if speaker:
+            return self._db.execute(FIND_TOKEN_BY_SPEAKER, (token, speaker)).fetchall()
+        return self._db.execute(FIND_TOKEN, (token,)).fetchall()
+
+    def talk_time(self, meeting=None, source="turns"):
+        """
+        (meeting, speaker, milliseconds, count) per speaker per meeting, from the
+        diarization turns or from the transcript segments. Overlapping rows of
+        one speaker count once: turns were merged when they were loaded, and
+        segments sum their talk_ms.
+        """
+        if source not in TALK_LENGTH:
+            raise Exception(f"talk_time source must be 'turns' or 'segments', not {source!r}")
+        if meeting is None:
+            return self._db.execute(TALK_TIME.format(length=TALK_LENGTH[source], table=source, where="")).fetchall()
+        query = TALK_TIME.format(length=TALK_LENGTH[source], table=source, where="WHERE t.meeting_id = ?")
+        return self._db.execute(query, (self.meeting_id(meeting),)).fetchall()
@@ -0,0 +1,130 @@
+import re
+
+from . import profiling
+
+ENCODING_NAME = "p50k_base"
+
+_encodings = {}
+
+# Match pattern with commas or periods before the milliseconds, and optional arrow
+# (sample-h's formatted_srt.md uses "00:00:01.364 00:00:02.279")
+SRT_LINE = re.compile(r'^\d+\s+(\d{2}):(\d{2}):(\d{2})[,.](\d{3})\s+(?:-->\s+)?(\d{2}):(\d{2}):(\d{2})[,.](\d{3})\s+SPEAKER_(\d+):\s*(.*)$')
+
+
+def get_encoding(name=ENCODING_NAME):
+    """
+    Return a tiktoken encoding, building it once per process.
+    tiktoken is imported here so text-only tools don't pay for it until they tokenize.
+    """
+    encoding = _encodings.get(name)
+    if encoding is None:
+        import tiktoken
+        encoding = _encodings[name] = tiktoken.get_encoding(name)
+    return encoding
+
+
+def tokenize_text(text, encoding=None):
+    """
+    Split a stripped transcript into tiktoken tokens.
+    Returns token dictionaries with speaker/start/end left empty for the merge step.
+    """
+    if encoding is None:
+        encoding = get_encoding()
+
+    with profiling.span("tokenize") as span:
+        encode = encoding.encode(text)
+
+        individual_tokens = [encoding.decode_single_token_bytes(token) for token in encode]
+        individual_tokens_str = [token.decode('utf-8', errors='replace') for token in individual_tokens]
+        filtered_tokens = [token for token in individual_tokens_str if token.strip()]
+
+        tokens = []
+        for i, token in enumerate(filtered_tokens):
+            tokens.append({
+                "token": token,
+                "id": i,
+                "speaker": None,
+                "start": None,
+                "end": None
+            })
+        span.add_items(len(tokens))
+    return tokens
+
+
+def format_time_mm_ss(total_seconds):
+    """
+    Convert total seconds to MM.SS format where SS is actual seconds (0-59).
+    Example: 65.5 seconds = 1 minute 5.5 seconds = 1.05 (not 1.655)
+    """
+    minutes = int(total_seconds // 60)
+    seconds = total_seconds % 60
+    return minutes + seconds / 100.0
+
+
+def mm_ss_to_seconds(mm_ss):
+    """Inverse of format_time_mm_ss."""
+    minutes = int(mm_ss)
+    return minutes * 60 + (mm_ss - minutes) * 100
+
+
+def parse_srt_speakers(srt_text):
+    """
+    Parse SRT-style speaker data and extract speaker segments with their text.
+    Returns a list of segments with speaker, start_time, end_time, and text.
+    """
+    segments = []
+
+    with profiling.span("parse_srt") as span:
+        for line in srt_text.strip().split('\n'):
+            match = SRT_LINE.match(line)
+
+            if match:
+                start_h, start_m, start_s, start_ms = map(int, match.groups()[0:4])
+                total_start_seconds = start_h * 3600 + start_m * 60 + start_s + start_ms / 1000.0
+
+                end_h, end_m, end_s, end_ms = map(int, match.groups()[4:8])
+                total_end_seconds = end_h * 3600 + end_m * 60 + end_s + end_ms / 1000.0
+
+                segments.append({
+                    'speaker': int(match.group(9)),
+                    'start': format_time_mm_ss(total_start_seconds),
+                    'end': format_time_mm_ss(total_end_seconds),
+                    'text': match.group(10).strip()
+                })
+        span.add_items(len(segments))
+
+    return segments
+
+
+def assign_speakers_to_tokens(tokens, speaker_segments):
+    """
+    Assign speaker numbers and timestamps to tokens based on time distribution.
+    Distributes tokens evenly across the total duration, then assigns speakers based on time.
+    """
+    if not tokens or not speaker_segments:
+        return tokens
+
+    start_time_seconds = mm_ss_to_seconds(speaker_segments[0]['start'])
+    total_end_seconds = mm_ss_to_seconds(speaker_segments[-1]['end'])
+    time_per_token = (total_end_seconds - start_time_seconds) / len(tokens)
+
+    # Segment bounds in seconds, converted once instead of once per token
+    bounds = [(mm_ss_to_seconds(s['start']), mm_ss_to_seconds(s['end']), s['speaker']) for s in speaker_segments]
+
+    with profiling.span("merge", category="loop", items=len(tokens)):
+        for i, token in enumerate(tokens):
+            token_time_seconds = start_time_seconds + (i * time_per_token)
+            token_time = format_time_mm_ss(token_time_seconds)
+
+            # If no segment found (shouldn't happen), use last segment's speaker
+            assigned_speaker = speaker_segments[-1]['speaker']
+            for seg_start, seg_end, speaker in bounds:
+                if seg_start <= token_time_seconds <= seg_end:
+                    assigned_speaker = speaker
+                    break
+
+            token['speaker'] = assigned_speaker
+            token['start'] = round(token_time, 2)
+            token['end'] = round(token_time, 2)
+
+    return tokens
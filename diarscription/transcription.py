@@ -0,0 +1,217 @@
+"""
+whisperx (and torch with it) is imported inside the functions that need it so
+that importing this module for its defaults stays cheap.
+"""
+from . import profiling
+from .audio import SAMPLE_RATE
+
+# Defaults from docs/activity-detection/examples/Parameters.py and the pseudocode
+MODEL_NAME = "large-v2"
+DEVICE = "cpu"
+COMPUTE_TYPE = "float32"
+BATCH_SIZE = 16
+CHUNK_SIZE = 6
+LANGUAGE = "en"
+THREADS = None  # None leaves the whisperx/torch defaults alone
+
+# vad_onset default: 0.5
+# Setting this lower will make the model more sensitive to detecting speech
+
+# vad_offset default: 0.363
+# Setting this higher will make the model less sensitive to detecting the end of speech
+VAD_ONSET = 0.5
+VAD_OFFSET = 0.363
+
+TUNABLE_SETTINGS = ("compute_type", "batch_size", "threads", "chunk_size", "vad_onset", "vad_offset")
+
+
+class _SpanProxy:
+    """
+    Wraps a callable (the VAD model whisperx keeps on the pipeline) so every
+    call is recorded as its own span nested inside "transcribe".
+    """
+    def __init__(self, target, name):
+        self._target = target
+        self._name = name
+
+    def __call__(self, *args, **kwargs):
+        with profiling.span(self._name):
+            return self._target(*args, **kwargs)
+
+    def __getattr__(self, attr):
+        return getattr(self._target, attr)
+
+
+def resolve_settings(model_name=MODEL_NAME, **explicit):
+    """
+    Settings for a transcription run: explicit values (anything not None) win,
+    then the autotuned profile saved for this host and model, then the module defaults.
+    """
+    from .autotune import load_host_profile  # autotune imports this module
+
+    settings = {
+        "compute_type": COMPUTE_TYPE,
+        "batch_size": BATCH_SIZE,
+        "threads": THREADS,
+        "chunk_size": CHUNK_SIZE,
+        "vad_onset": VAD_ONSET,
+        "vad_offset": VAD_OFFSET,
+    }
+    tuned = load_host_profile(model_name)
+    settings.update((key, value) for key, value in tuned.items() if key in TUNABLE_SETTINGS)
+    settings.update((key, value) for key, value in explicit.items() if value is not None)
+    return settings
+
+
+def load_model(model_name=MODEL_NAME, device=DEVICE, compute_type=COMPUTE_TYPE,
+               language=LANGUAGE, vad_onset=VAD_ONSET, vad_offset=VAD_OFFSET, threads=THREADS, asr_options=None):
+    import whisperx
+
+    options = {}
+    if asr_options:
+        options["asr_options"] = asr_options  # decoder options, e.g. {"temperatures": [0.2, 0.4]}
+    if threads:
+        import torch
+        torch.set_num_threads(threads)  # VAD and alignment run on torch
+        options["threads"] = threads    # CTranslate2 threads for the whisper decoder
+
+    with profiling.span("load_model", model=model_name, compute_type=compute_type):
+        model = whisperx.load_model(
+            model_name,
+            device,
+            compute_type=compute_type,
+            language=language,
+            vad_options={"vad_onset": vad_onset, "vad_offset": vad_offset},
+            **options,
+        )
+    if profiling.is_enabled() and hasattr(model, "vad_model"):
+        model.vad_model = _SpanProxy(model.vad_model, "vad")
+    return model
+
+
+def set_asr_options(model, asr_options):
+    """
+    Change decoder options (e.g. {"temperatures": [...]}) of a loaded model in
+    place, so a retry with other settings doesn't need a second copy of the
+    model in memory. Returns the previous options.
+    """
+    import dataclasses
+
+    previous = model.options
+    if dataclasses.is_dataclass(previous):  # faster-whisper >= 1.0
+        model.options = dataclasses.replace(previous, **asr_options)
+    else:
+        model.options = previous._replace(**asr_options)
+    return previous
+
+
+def transcribe(model, audio, batch_size=BATCH_SIZE, chunk_size=CHUNK_SIZE):
+    """
+    Run VAD + Whisper over a 16kHz float32 audio array.
+    Returns the whisperx result dict with "segments" and "language".
+    """
+    with profiling.span("transcribe") as span:
+        result = model.transcribe(audio, batch_size=batch_size, chunk_size=chunk_size)
+        span.add_items(len(result["segments"]))
+    return result
+
+
+def load_align_model(language, device=DEVICE):
+    """(model, metadata) for align(), for callers that align more than once."""
+    import whisperx
+
+    with profiling.span("load_align_model", language=language):
+        return whisperx.load_align_model(language_code=language, device=device)
+
+
+def align(result, audio, device=DEVICE, align_model=None):
+    """
+    Force-align whisper segments to get word-level timestamps.
+    Pass align_model from load_align_model() to skip loading it again.
+    """
+    import whisperx
+
+    with profiling.span("align") as span:
+        model_a, metadata = align_model or load_align_model(result["language"], device)
+        aligned = whisperx.align(result["segments"], model_a, metadata, audio, device, return_char_alignments=False)
+        span.add_items(len(aligned.get("word_segments", [])))
+    aligned.setdefault("language", result["language"])
+    return aligned
+
+
+def shift_segments(segments, offset):
+    """Move timestamps of segments transcribed from a slice of the audio onto the timeline of the whole file."""
+    for segment in segments:
+        for item in [segment] + segment.get("words", []):
+            if "start" in item:
+                item["start"] = round(item["start"] + offset, 3)
+            if "end" in item:
+                item["end"] = round(item["end"] + offset, 3)
+    return segments
+
+
+def window_segments(segments, window):
+    """Segments whose midpoint falls inside window ({"start", "end"} in seconds)."""
+    return [segment for segment in segments if window["start"] <= (segment["start"] + segment["end"]) / 2 < window["end"]]
+
+
+def clip_segments(segments, start, end):
+    """
+    The part of segments that lies in [start, end). Words are kept by their
+    midpoint (words without timings follow the word before them) and each
+    segment is trimmed to the words it keeps, or dropped if none are left.
+    Segments without word timings are kept by their own midpoint.
+
+    Re-decoded windows are padded for context; clipping the new segments to
+    the unpadded span keeps words from the padding, which the neighbouring
+    segments already hold, out of the result.
+    """
+    clipped = []
+    for segment in segments:
+        words = segment.get("words") or []
+        decisions = [start <= (word["start"] + word["end"]) / 2 < end
+                     for word in words if "start" in word and "end" in word]
+        if not decisions:
+            if start <= (segment["start"] + segment["end"]) / 2 < end:
+                clipped.append(segment)
+            continue
+        kept = []
+        inside = decisions[0]
+        for word in words:
+            if "start" in word and "end" in word:
+                inside = start <= (word["start"] + word["end"]) / 2 < end
+            if inside:
+                kept.append(word)
+        if len(kept) == len(words):
+            clipped.append(segment)
+        elif kept:
+            timed = [word for word in kept if "start" in word and "end" in word]
+            prefix = " " if segment.get("text", "").startswith(" ") else ""
+            clipped.append(dict(segment, words=kept, start=timed[0]["start"], end=timed[-1]["end"],
+                                text=prefix + " ".join(word["word"] for word in kept)))
+    return clipped
+
+
+def transcribe_windows(model, audio, windows, language=None, device=DEVICE, batch_size=BATCH_SIZE,
+                       chunk_size=CHUNK_SIZE, align_words=True):
+    """
+    Transcribe only the given time windows of the audio.
+
+    Each window is transcribed on its own and its segments are moved onto the
+    timeline of the whole file. All windows are then word-aligned in one pass,
+    since whisperx cuts each segment out of the full audio anyway.
+
+    Returns:
+        One list of segments per window
+    """
+    decoded = []
+    for window in windows:
+        clip = audio[int(window["start"] * SAMPLE_RATE):int(window["end"] * SAMPLE_RATE)]
+        segments = transcribe(model, clip, batch_size=batch_size, chunk_size=chunk_size)["segments"] if len(clip) else []
+        decoded.append(shift_segments(segments, window["start"]))
+
+    if align_words and any(decoded):
+        aligned = align({"segments": [segment for segments in decoded for segment in segments],
+                         "language": language or LANGUAGE}, audio, device=device)["segments"]
+        decoded = [window_segments(aligned, window) for window in windows]
+    return decoded
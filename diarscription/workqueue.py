@@ -0,0 +1,369 @@
+"""
+Work queue for spreading jobs over several machines.
+
+A queue is a directory on storage every node can reach (an NFS/SMB share, or
+a local directory when all workers run on one machine):
+
+    queue.sqlite    the jobs table
+    artifacts/      one directory per finished job
+
+A coordinator enqueues one job per input file, and any number of workers on
+any node claim jobs from it:
+
+    python -m diarscription queue /mnt/shared/q enqueue meetings/*.mp3 --kind run
+    python -m diarscription worker /mnt/shared/q            # on every box, as often as it has cores for
+    python -m diarscription queue /mnt/shared/q status
+
+A claim takes a lease on the job. While the job runs, a heartbeat thread
+renews the lease. If a worker dies or loses its node, the lease runs out and
+the next claim puts the job back in the queue. After max_attempts tries the
+job is marked failed. A job writes its outputs into a private directory,
+which is renamed into artifacts/ under a name of its own once the job has
+finished. The job is then marked done only if the worker still owns it, and
+its result points at that directory; a worker that lost its lease removes
+its copy and never touches the outputs of the one that took over.
+
+SQLite runs with its default rollback journal rather than WAL, because WAL
+needs shared memory and doesn't work on network file systems. Every state
+change is one short BEGIN IMMEDIATE transaction.
+"""
+import json
+import os
+import shutil
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+
+from . import profiling
+
+LEASE_SECONDS = 120.0
+POLL_SECONDS = 2.0
+MAX_ATTEMPTS = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'queued',      -- queued, running, done, failed
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    worker TEXT,
+    lease_until REAL,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    result TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, id);
+"""
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class WorkQueue:
+    """
+    A job queue in a shared directory.
+
+    Args:
+        path: Queue directory (created if missing)
+        timeout: Seconds to wait for another node's lock on the database
+    """
+    def __init__(self, path, timeout=60.0):
+        self.path = path
+        self.artifacts = os.path.join(path, "artifacts")
+        os.makedirs(self.artifacts, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(path, "queue.sqlite"), timeout=timeout, isolation_level=None,
+                                   check_same_thread=False)
+        self._lock = threading.Lock()  # the heartbeat thread shares the connection
+        self._db.executescript(SCHEMA)
+
+    def _transaction(self):
+        return _Transaction(self._db, self._lock)
+
+    def close(self):
+        self._db.close()
+
+    def enqueue(self, kind, payloads, max_attempts=MAX_ATTEMPTS):
+        """
+        Add one job per payload (JSON-serializable dicts).
+
+        Returns:
+            Number of jobs added
+        """
+        now = time.time()
+        rows = [(kind, json.dumps(payload), max_attempts, now) for payload in payloads]
+        with self._transaction() as db:
+            db.executemany("INSERT INTO jobs (kind, payload, max_attempts, created) VALUES (?, ?, ?, ?)", rows)
+        return len(rows)
+
+    def _expire_leases(self, db, now):
+        db.execute("UPDATE jobs SET state = 'failed', error = 'lease expired ' || attempts || ' times', "
+                   "worker = NULL, finished = ? "
+                   "WHERE state = 'running' AND lease_until < ? AND attempts >= max_attempts", (now, now))
+        db.execute("UPDATE jobs SET state = 'queued', worker = NULL "
+                   "WHERE state = 'running' AND lease_until < ?", (now,))
+
+    def claim(self, worker, lease=LEASE_SECONDS):
+        """
+        Take the oldest queued job, re-queueing expired leases first.
+
+        Returns:
+            (job id, kind, payload dict) or None if nothing is queued
+        """
+        now = time.time()
+        with self._transaction() as db:
+            self._expire_leases(db, now)
+            row = db.execute("SELECT id, kind, payload FROM jobs WHERE state = 'queued' ORDER BY id LIMIT 1").fetchone()
+            if row is None:
+                return None
+            db.execute("UPDATE jobs SET state = 'running', worker = ?, lease_until = ?, started = ?, "
+                       "attempts = attempts + 1 WHERE id = ?", (worker, now + lease, now, row[0]))
+        return row[0], row[1], json.loads(row[2])
+
+    def heartbeat(self, job_id, worker, lease=LEASE_SECONDS):
+        """
+        Extend the lease. Returns False if the job is no longer this worker's
+        (the lease ran out and someone else took it).
+        """
+        with self._transaction() as db:
+            cursor = db.execute("UPDATE jobs SET lease_until = ? WHERE id = ? AND worker = ? AND state = 'running'",
+                                (time.time() + lease, job_id, worker))
+        return cursor.rowcount == 1
+
+    def complete(self, job_id, worker, result=None):
+        with self._transaction() as db:
+            cursor = db.execute("UPDATE jobs SET state = 'done', result = ?, finished = ?, lease_until = NULL "
+                                "WHERE id = ? AND worker = ? AND state = 'running'",
+                                (json.dumps(result), time.time(), job_id, worker))
+        return cursor.rowcount == 1
+
+    def fail(self, job_id, worker, error):
+        """Record a failure; the job goes back to the queue until it runs out of attempts."""
+        with self._transaction() as db:
+            cursor = db.execute("UPDATE jobs SET state = CASE WHEN attempts >= max_attempts THEN 'failed' "
+                                "ELSE 'queued' END, error = ?, worker = NULL, lease_until = NULL, "
+                                "finished = CASE WHEN attempts >= max_attempts THEN ? ELSE finished END "
+                                "WHERE id = ? AND worker = ? AND state = 'running'",
+                                (error, time.time(), job_id, worker))
+        return cursor.rowcount == 1
+
+    def retry_failed(self):
+        """Give failed jobs a fresh set of attempts."""
+        with self._transaction() as db:
+            cursor = db.execute("UPDATE jobs SET state = 'queued', attempts = 0, error = NULL WHERE state = 'failed'")
+        return cursor.rowcount
+
+    def status(self):
+        """{state: job count}"""
+        with self._lock:
+            rows = self._db.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall()
+        return dict(rows)
+
+    def jobs(self, state=None):
+        query = "SELECT id, kind, payload, state, attempts, worker, started, finished, error FROM jobs"
+        params = ()
+        if state:
+            query += " WHERE state = ?"
+            params = (state,)
+        with self._lock:
+            rows = self._db.execute(query + " ORDER BY id", params).fetchall()
+        keys = ("id", "kind", "payload", "state", "attempts", "worker", "started", "finished", "error")
+        return [dict(zip(keys, row), payload=json.loads(row[2])) for row in rows]
+
+    def artifact_dir(self, job_id, payload, worker=None):
+        """
+        Output directory of a job. With a worker, the name is that worker's
+        own, so two workers that both ran the job never write to the same place.
+        """
+        name = payload.get("name") or os.path.splitext(os.path.basename(payload.get("input", "")))[0]
+        base = f"{job_id:06d}-{name}" if name else f"{job_id:06d}"
+        if worker:
+            base += "." + worker.replace(":", "-")
+        return os.path.join(self.artifacts, base)
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT, rolled back on error, under the connection lock."""
+    def __init__(self, db, lock):
+        self.db = db
+        self.lock = lock
+
+    def __enter__(self):
+        self.lock.acquire()
+        try:
+            self.db.execute("BEGIN IMMEDIATE")
+        except BaseException:
+            self.lock.release()
+            raise
+        return self.db
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.db.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            self.lock.release()
+        return False
+
+
+# Job kinds. Each handler gets the payload and a private output directory,
+# and returns a JSON-serializable result.
+
+def _run_pipeline(payload, output_dir):
+    from . import pipeline
+
+    options = dict(payload.get("options", {}))
+    hf_token = options.pop("hf_token", None) or os.environ.get("HF_TOKEN")
+    pipeline.run(payload["input"], output_dir, hf_token, **options)
+    return {"outputs": sorted(os.listdir(output_dir))}
+
+
+def _run_transcribe(payload, output_dir):
+    from . import audio, transcription
+
+    options = dict(payload.get("options", {}))
+    model_name = options.pop("model_name", transcription.MODEL_NAME)
+    settings = transcription.resolve_settings(model_name, **options)
+    samples = audio.load_audio(payload["input"])
+    model = transcription.load_model(model_name, compute_type=settings["compute_type"],
+                                     vad_onset=settings["vad_onset"], vad_offset=settings["vad_offset"],
+                                     threads=settings["threads"])
+    result = transcription.transcribe(model, samples, batch_size=settings["batch_size"],
+                                      chunk_size=settings["chunk_size"])
+    result = transcription.align(result, samples)
+    with open(os.path.join(output_dir, "whisperx_output.json"), "w", encoding="utf-8") as f:
+        json.dump(result, f, default=float)
+    return {"segments": len(result["segments"])}
+
+
+def _run_export(payload, output_dir):
+    from . import export
+
+    # same uncached path as `diarscription export` without --cache-dir
+    with open(payload["input"], "r", encoding="utf-8") as f:
+        whisperx_data = json.load(f)
+    token_array = export.create_token_array(whisperx_data)
+    export.write_token_array(token_array, os.path.join(output_dir, "token_array.json"))
+    export.create_final_srt_file(token_array, whisperx_data, os.path.join(output_dir, "final_transcript.srt"))
+    return {"tokens": len(token_array)}
+
+
+def _run_tokens(payload, output_dir):
+    from . import corpus
+
+    summary = corpus.process_sample(payload["input"], output_dir)
+    summary.pop("spans", None)
+    if "error" in summary:
+        raise Exception(summary["error"])
+    return summary
+
+
+HANDLERS = {
+    "run": _run_pipeline,
+    "transcribe": _run_transcribe,
+    "export": _run_export,
+    "tokens": _run_tokens,
+}
+
+
+def _heartbeat_loop(queue, job_id, worker, lease, stop, lost):
+    """
+    Renew the lease every lease / 3 seconds. Sets lost, and stops, once the
+    job is no longer this worker's or the lease can't be renewed in time.
+    """
+    renewed = time.time()
+    while not stop.wait(lease / 3):
+        try:
+            if not queue.heartbeat(job_id, worker, lease):
+                lost.set()
+                return
+            renewed = time.time()
+        except sqlite3.Error:
+            # shared storage hiccup (locked, I/O or corruption errors on a network
+            # file system): try again next beat, unless the lease runs out first
+            if time.time() + lease / 3 >= renewed + lease:
+                lost.set()
+                return
+        except Exception:
+            lost.set()  # can't tell whether the job is still ours; treat it as lost
+            return
+
+
+def run_job(queue, job_id, kind, payload, worker, lease=LEASE_SECONDS):
+    """
+    Run one claimed job with a heartbeat, then publish its artifacts and record the outcome.
+
+    Returns:
+        True if the job finished and was recorded as done
+    """
+    final_dir = queue.artifact_dir(job_id, payload, worker)
+    work_dir = os.path.join(queue.artifacts, "." + os.path.basename(final_dir))
+    shutil.rmtree(work_dir, ignore_errors=True)
+    os.makedirs(work_dir)
+
+    stop = threading.Event()
+    lost = threading.Event()
+    beat = threading.Thread(target=_heartbeat_loop, args=(queue, job_id, worker, lease, stop, lost), daemon=True)
+    beat.start()
+    try:
+        with profiling.span("job", kind=kind, job=job_id):
+            if kind not in HANDLERS:
+                raise Exception(f"unknown job kind {kind!r}")
+            result = HANDLERS[kind](payload, work_dir)
+    except Exception as e:
+        stop.set()
+        beat.join()
+        shutil.rmtree(work_dir, ignore_errors=True)
+        queue.fail(job_id, worker, f"{type(e).__name__}: {e}\n{traceback.format_exc()}")
+        return False
+    stop.set()
+    beat.join()
+
+    if lost.is_set() or not queue.heartbeat(job_id, worker, lease):
+        # another worker owns the job now; its copy of the outputs wins
+        shutil.rmtree(work_dir, ignore_errors=True)
+        return False
+    # final_dir is this worker's own, so publishing can't replace anyone else's
+    # outputs; complete() only marks the job done if it is still ours
+    os.replace(work_dir, final_dir)
+    if queue.complete(job_id, worker, dict(result or {}, artifacts=os.path.relpath(final_dir, queue.path))):
+        return True
+    shutil.rmtree(final_dir, ignore_errors=True)
+    return False
+
+
+def run_worker(path, worker=None, lease=LEASE_SECONDS, poll=POLL_SECONDS, exit_when_empty=False, max_jobs=None,
+               log=print):
+    """
+    Claim and run jobs until the queue is empty (with exit_when_empty) or forever.
+
+    Returns:
+        (jobs done, jobs failed) by this worker
+    """
+    worker = worker or worker_name()
+    queue = WorkQueue(path)
+    done = failed = 0
+    try:
+        while max_jobs is None or done + failed < max_jobs:
+            claimed = queue.claim(worker, lease)
+            if claimed is None:
+                if exit_when_empty and not queue.status().get("running"):
+                    break
+                time.sleep(poll)
+                continue
+            job_id, kind, payload = claimed
+            start = time.perf_counter()
+            if run_job(queue, job_id, kind, payload, worker, lease):
+                done += 1
+                log(f"✓ [{worker}] job {job_id} ({kind} {payload.get('input', '')}) in {time.perf_counter() - start:.1f}s")
+            else:
+                failed += 1
+                log(f"✗ [{worker}] job {job_id} ({kind} {payload.get('input', '')})")
+    finally:
+        queue.close()
+    return done, failed
@@ -0,0 +1,56 @@
+import json
+import multiprocessing
+import os
+
+from diarscription import workqueue
+
+WORKERS = 4
+JOBS = 24
+
+
+def _whisperx_file(path, words):
+    segment_words = [{"word": f"w{i}", "start": i * 0.5, "end": i * 0.5 + 0.4, "score": 0.9, "speaker": "SPEAKER_00"}
+                     for i in range(words)]
+    result = {"segments": [{"start": 0.0, "end": words * 0.5, "text": " ".join(word["word"] for word in segment_words),
+                            "speaker": "SPEAKER_00", "words": segment_words}],
+              "word_segments": segment_words, "language": "en"}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(result, f)
+    return str(path)
+
+
+def test_workers_share_a_queue(tmp_path):
+    queue_dir = str(tmp_path / "queue")
+    words = {_whisperx_file(tmp_path / f"meeting-{i:02d}.json", words=i + 1): i + 1 for i in range(JOBS)}
+    queue = workqueue.WorkQueue(queue_dir)
+    queue.enqueue("export", [{"input": path} for path in words], max_attempts=2)
+    queue.enqueue("export", [{"input": str(tmp_path / "missing.json")}], max_attempts=2)
+
+    context = multiprocessing.get_context("spawn")
+    workers = [context.Process(target=workqueue.run_worker, args=(queue_dir,),
+                               kwargs={"poll": 0.05, "exit_when_empty": True})
+               for _ in range(WORKERS)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(timeout=120)
+        assert worker.exitcode == 0
+
+    jobs = queue.jobs()
+    done = [job for job in jobs if job["state"] == "done"]
+    assert len(done) == JOBS
+    assert all(job["attempts"] == 1 for job in done)
+
+    failed = [job for job in jobs if job["state"] == "failed"]
+    assert [job["payload"]["input"] for job in failed] == [str(tmp_path / "missing.json")]
+    assert failed[0]["attempts"] == 2 and failed[0]["finished"] is not None
+
+    # exactly one published copy per finished job, holding all of its words
+    published = sorted(name for name in os.listdir(queue.artifacts) if not name.startswith("."))
+    assert len(published) == JOBS
+    for job in done:
+        prefix = f"{job['id']:06d}-"
+        (directory,) = [name for name in published if name.startswith(prefix)]
+        with open(os.path.join(queue.artifacts, directory, "token_array.json"), "r", encoding="utf-8") as f:
+            assert len(json.load(f)) == words[job["payload"]["input"]]
+    queue.close()